@@ -0,0 +1,72 @@
+"""
+Compare serial and parallel generation of all icon sizes.
+
+Run from the repository root (requires Pillow):
+
+    python benchmarks/icon_sizes.py
+"""
+
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from script2bundle import _render_icon_sizes  # noqa: E402
+
+REPEAT = 5
+
+
+def make_master(file: Path) -> None:
+    """
+    Create a noisy 1024x1024 master png.
+
+    Parameters
+    ----------
+    file : Path
+        The png to be written.
+    """
+    channels = [Image.effect_noise((1024, 1024), 64) for _ in range(3)]
+    channels.append(Image.radial_gradient("L").resize((1024, 1024)))
+    Image.merge("RGBA", channels).save(file)
+
+
+def best_time(master: Path, workers: int) -> float:
+    """
+    Return the fastest of several runs.
+
+    Parameters
+    ----------
+    master : Path
+        The master png.
+    workers : int
+        The number of threads.
+
+    Returns
+    -------
+    float
+        The time in seconds.
+    """
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        _render_icon_sizes(master, workers)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """Print the timings of serial and parallel generation."""
+    with TemporaryDirectory() as tmp:
+        master = Path(tmp) / "master.png"
+        make_master(master)
+        serial = best_time(master, 1)
+        parallel = best_time(master, None)
+    print(f"serial:   {serial * 1000:8.1f} ms")
+    print(f"parallel: {parallel * 1000:8.1f} ms ({serial / parallel:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compare the startup time of a plain and a fast-launcher bundle.
+
+Both bundles wrap the same Python script, once a small one and once
+one of about 6000 lines. The median wall time of starting the
+executable in Contents/MacOS is reported, once cold and once warm:
+
+- cold: every run builds a new bundle and times its first start, like
+  the first start after installing the app.
+- warm: one bundle is started once and then timed repeatedly.
+
+Both bundles use the bytecode cache of the installed Python and the
+file cache of the operating system stays warm. Python compiles the
+main script on every start; the stub runs the bytecode compiled at
+build time instead, so the gain grows with the size of the script.
+Run from the repository root:
+
+    python benchmarks/launcher_startup.py
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from script2bundle import ApplicationBundle  # noqa: E402
+
+RUNS = 30
+
+small_script = f"""#!{sys.executable}
+import json
+import sys
+
+print(json.dumps(sys.argv))
+"""
+# a script of about 6000 lines; Python compiles the main script on
+# every start, the stub loads the bytecode compiled at build time
+large_script = small_script + "".join(
+    f"\n\ndef function_{i}(x):\n    return [x * {i} for _ in range(3)]\n" for i in range(1500)
+)
+
+
+def build(executable: Path, name: str, fast: bool) -> Path:
+    """
+    Build a bundle next to the executable.
+
+    Parameters
+    ----------
+    executable : Path
+        The Python script.
+    name : str
+        The filename of the bundle.
+    fast : bool
+        Use the fast launcher stub.
+
+    Returns
+    -------
+    Path
+        The executable in Contents/MacOS.
+    """
+    bundle = ApplicationBundle(executable)
+    bundle.set_filename(name)
+    if fast:
+        bundle.set_fast_launcher()
+    return bundle.write_bundle() / "Contents" / "MacOS" / executable.name
+
+
+def startup(executable: Path) -> float:
+    """
+    Return the wall time of running an executable once.
+
+    Parameters
+    ----------
+    executable : Path
+        The executable in Contents/MacOS.
+
+    Returns
+    -------
+    float
+        The time in seconds.
+    """
+    start = time.perf_counter()
+    subprocess.run([executable], check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def main():
+    """Build the bundles and print their startup times."""
+    with TemporaryDirectory() as tmp:
+        executable = Path(tmp) / "startup"
+        for size, script in [("small", small_script), ("large", large_script)]:
+            executable.write_text(script)
+            os.chmod(executable, 0o755)
+            for fast in [False, True]:
+                label = f"{size} {'fast ' if fast else 'plain'}"
+                cold = [
+                    startup(build(executable, f"{size}{fast}{run}", fast)) for run in range(RUNS)
+                ]
+                warm_executable = build(executable, f"{size}{fast}", fast)
+                startup(warm_executable)
+                warm = [startup(warm_executable) for _ in range(RUNS)]
+                print(f"{label} cold: {statistics.median(cold) * 1000:6.1f} ms")
+                print(f"{label} warm: {statistics.median(warm) * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
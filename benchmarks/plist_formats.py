@@ -0,0 +1,70 @@
+"""
+Compare XML and binary Info.plist for many document types.
+
+Run from the repository root:
+
+    python benchmarks/plist_formats.py
+"""
+
+import os
+import plistlib
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from script2bundle import ApplicationBundle  # noqa: E402
+
+DOCUMENT_TYPES = [10, 100, 500]
+REPEAT = 50
+
+
+def best_time(function, *args, **kwargs) -> float:
+    """
+    Return the fastest of several calls.
+
+    Parameters
+    ----------
+    function : callable
+        The function to be timed.
+    *args
+        The arguments of the function.
+    **kwargs
+        The keyword arguments of the function.
+
+    Returns
+    -------
+    float
+        The time in seconds.
+    """
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """Print size, serialization and parse time for both formats."""
+    with TemporaryDirectory() as tmp:
+        executable = Path(tmp) / "benchmark"
+        executable.write_text("#!/bin/sh\n")
+        os.chmod(executable, 0o755)
+        print(f"{'types':>6} {'format':>7} {'bytes':>8} {'dumps ms':>9} {'loads ms':>9}")
+        for count in DOCUMENT_TYPES:
+            bundle = ApplicationBundle(executable)
+            for number in range(count):
+                bundle.add_document_type(f"ext{number}", "Editor" if number % 2 else None)
+            for name, fmt in [("xml", plistlib.FMT_XML), ("binary", plistlib.FMT_BINARY)]:
+                data = plistlib.dumps(bundle.plist_dict, fmt=fmt, sort_keys=True)
+                dumps = best_time(plistlib.dumps, bundle.plist_dict, fmt=fmt)
+                loads = best_time(plistlib.loads, data)
+                print(
+                    f"{count:>6} {name:>7} {len(data):>8} {dumps * 1000:>9.3f} {loads * 1000:>9.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
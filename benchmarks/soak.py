@@ -0,0 +1,166 @@
+"""
+Build thousands of bundles in one process and watch for leaks.
+
+Every build uses the real `ApplicationBundle` and `write_bundle` paths
+with a synthetic executable, icon and resources inside a temporary
+directory. RSS, open file descriptors, files in the temp directory and
+the build latency are sampled over time. The run fails (exit code 1) if
+any of them grows beyond its threshold. Linux only (/proc). Run from
+the repository root:
+
+    python benchmarks/soak.py --builds 10000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from script2bundle import ApplicationBundle, FileEntry  # noqa: E402
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def png(size: int, seed: int) -> bytes:
+    """
+    Encode a simple RGBA png without any imaging library.
+
+    Parameters
+    ----------
+    size : int
+        The edge length in pixels.
+    seed : int
+        Varies the pixel values between icons.
+
+    Returns
+    -------
+    bytes
+        The png file.
+    """
+    row = bytes((seed + x) % 256 for x in range(size * 4))
+    pixels = b"".join(b"\x00" + row for _ in range(size))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        crc = zlib.crc32(kind + data)
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(pixels))
+        + chunk(b"IEND", b"")
+    )
+
+
+def rss() -> int:
+    """Return the resident set size of this process in bytes."""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE
+
+
+def open_files() -> int:
+    """Return the number of open file descriptors."""
+    return len(os.listdir("/proc/self/fd"))
+
+
+def temp_files() -> int:
+    """Return the number of entries in the temp directory."""
+    return len(os.listdir(tempfile.gettempdir()))
+
+
+def build(folder: Path, number: int, rng: random.Random) -> float:
+    """
+    Build one bundle and return its latency.
+
+    Parameters
+    ----------
+    folder : Path
+        The working directory of the run.
+    number : int
+        The number of the build.
+    rng : random.Random
+        The source of the synthetic content.
+
+    Returns
+    -------
+    float
+        The time in seconds.
+    """
+    executable = folder / f"soak{number % 16}"
+    executable.write_bytes(
+        b"#!/bin/sh\n# " + rng.randbytes(rng.randint(1, 64 * 1024)).hex().encode()
+    )
+    os.chmod(executable, 0o755)
+    icon = folder / "icon.png"
+    icon.write_bytes(png(128, number))
+    start = time.perf_counter()
+    bundle = ApplicationBundle(executable)
+    bundle.set_icon(icon)
+    for resource in range(rng.randint(1, 8)):
+        content = FileEntry(rng.randbytes(rng.randint(0, 32 * 1024)), "0o644")
+        bundle.save_file(Path("Contents") / "Resources" / f"resource{resource}", content)
+    bundle.set_CFBundleDisplayName(f"Soak {number}")
+    bundle.set_extension(f"soak{number % 16}")
+    bundle.write_bundle()
+    return time.perf_counter() - start
+
+
+def main():
+    """Run the soak test and check the thresholds."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--builds", type=int, default=10000)
+    parser.add_argument("--sample", type=int, default=500, help="Builds per sample.")
+    parser.add_argument("--max-rss-growth", type=float, default=32, help="In MiB.")
+    parser.add_argument(
+        "--max-latency-growth", type=float, default=1.5, help="Factor of the median latency."
+    )
+    args = parser.parse_args()
+    rng = random.Random(0)
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        baseline_files = temp_files()
+        latencies = []
+        print(
+            f"{'builds':>8} {'rss MiB':>8} {'fds':>5} {'tmp':>5} {'median ms':>10} {'max ms':>8}"
+        )
+        for number in range(1, args.builds + 1):
+            latencies.append(build(folder, number, rng))
+            if number % args.sample == 0 or number == args.builds:
+                sample = (
+                    number,
+                    rss() / 2**20,
+                    open_files(),
+                    temp_files() - baseline_files,
+                    statistics.median(latencies) * 1000,
+                    max(latencies) * 1000,
+                )
+                samples.append(sample)
+                print("{:>8} {:>8.1f} {:>5} {:>5} {:>10.2f} {:>8.2f}".format(*sample))
+                latencies = []
+    # the first sample includes the warm-up and is only the reference
+    first, last = samples[min(1, len(samples) - 1)], samples[-1]
+    failures = []
+    if last[1] - first[1] > args.max_rss_growth:
+        failures.append(f"RSS grew by {last[1] - first[1]:.1f} MiB")
+    if last[2] > first[2]:
+        failures.append(f"open file descriptors grew from {first[2]} to {last[2]}")
+    if last[3] > first[3]:
+        failures.append(f"temp files grew from {first[3]} to {last[3]}")
+    if last[4] > first[4] * args.max_latency_growth:
+        failures.append(f"median latency grew from {first[4]:.2f} to {last[4]:.2f} ms")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare full builds with stamping bundles from a template.
+
+Every bundle wraps its own executable and has the same icon with all
+sizes derived from a 1024x1024 master. Run from the repository root
+(requires Pillow):
+
+    python benchmarks/template_stamping.py
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from script2bundle import ApplicationBundle  # noqa: E402
+
+BUNDLES = 50
+
+
+def make_executables(folder: Path) -> list:
+    """
+    Create executables that only differ in their name.
+
+    Parameters
+    ----------
+    folder : Path
+        The directory of the executables (and later the bundles).
+
+    Returns
+    -------
+    list
+        The paths of the executables.
+    """
+    executables = []
+    for number in range(BUNDLES):
+        executable = folder / f"wrapper{number}"
+        executable.write_text(f"#!/bin/sh\necho {number}\n")
+        os.chmod(executable, 0o755)
+        executables.append(executable)
+    return executables
+
+
+def full_builds(executables: list, icon: Path) -> float:
+    """
+    Build every bundle from scratch.
+
+    Parameters
+    ----------
+    executables : list
+        The executables to be bundled.
+    icon : Path
+        The master png.
+
+    Returns
+    -------
+    float
+        The time in seconds.
+    """
+    start = time.perf_counter()
+    for executable in executables:
+        bundle = ApplicationBundle(executable)
+        bundle.set_icon(icon, all_sizes=True)
+        bundle.write_bundle()
+    return time.perf_counter() - start
+
+
+def stamped_builds(executables: list, icon: Path, template: Path) -> float:
+    """
+    Save a template once and stamp every bundle from it.
+
+    Parameters
+    ----------
+    executables : list
+        The executables to be bundled.
+    icon : Path
+        The master png.
+    template : Path
+        The template directory.
+
+    Returns
+    -------
+    float
+        The time in seconds (including saving the template).
+    """
+    start = time.perf_counter()
+    skeleton = ApplicationBundle(executables[0])
+    skeleton.set_icon(icon, all_sizes=True)
+    skeleton.save_template(template)
+    for executable in executables:
+        bundle = ApplicationBundle(executable)
+        bundle.set_template(template)
+        bundle.write_bundle()
+    return time.perf_counter() - start
+
+
+def main():
+    """Print the timings of both approaches."""
+    with TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        icon = folder / "master.png"
+        Image.radial_gradient("L").resize((1024, 1024)).convert("RGBA").save(icon)
+        executables = make_executables(folder)
+        full = full_builds(executables, icon)
+        stamped = stamped_builds(executables, icon, folder / "template")
+    print(f"{BUNDLES} full builds:    {full:6.2f} s")
+    print(f"{BUNDLES} stamped builds: {stamped:6.2f} s ({full / stamped:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
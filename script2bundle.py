@@ -16,20 +16,53 @@ https://developer.apple.com/library/archive/documentation/FileManagement/Concept
 """
 
 import argparse
+import atexit
+import base64
+import ctypes
+import hashlib
+import io
+import json
 import os
 import plistlib
 import re
+import shlex
 import shutil
+import sqlite3
 import string
+import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from tempfile import NamedTemporaryFile
 from typing import NamedTuple, Optional
 
 import icnsutil
+from icnsutil import RawData
 
 LAUNCHER_NAME = "terminallauncher"
+HASH_CHUNK_SIZE = 1 << 20
+# ioctl request to clone (reflink) a file on Linux (btrfs, xfs)
+FICLONE = 0x40049409
+FAST_LAUNCHER_FLAGS = "-I"
+# 1980-01-01, the earliest modification time zip archives can store
+ZIP_EPOCH = 315532800
+# the C library providing clonefile on macOS
+_LIBC = ctypes.CDLL(None, use_errno=True) if sys.platform == "darwin" else None
+# icns media types and their edge length in pixels (16x16 to 512x512@2x)
+ICON_SIZES = {
+    "icp4": 16,
+    "ic11": 32,
+    "icp5": 32,
+    "ic12": 64,
+    "ic07": 128,
+    "ic13": 256,
+    "ic08": 256,
+    "ic14": 512,
+    "ic09": 512,
+    "ic10": 1024,
+}
 
 
 class FileEntry(NamedTuple):
@@ -47,12 +80,681 @@ class FileEntry(NamedTuple):
     permissions: Optional[str]
 
 
+class _DiskFile(NamedTuple):
+    """
+    Refer to a file on the disk without reading its content.
+
+    path : Path
+        The file on the disk.
+    size : int
+        The size in bytes.
+    inode : tuple
+        The device and inode number, shared by hardlinks.
+    """
+
+    path: Path
+    size: int
+    inode: tuple
+
+
+def _sha256(data: bytes) -> str:
+    """
+    Calculate the hex digest of some content.
+
+    Parameters
+    ----------
+    data : bytes
+        The content to be hashed.
+
+    Returns
+    -------
+    str
+        The SHA-256 hex digest.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def _sha256_file(file: Path) -> str:
+    """
+    Calculate the hex digest of a file without reading it at once.
+
+    Parameters
+    ----------
+    file : Path
+        The file to be hashed.
+
+    Returns
+    -------
+    str
+        The SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(file, "rb") as f:
+        while size := f.readinto(buffer):
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    """
+    Hardlink a file and fall back to copying it.
+
+    Parameters
+    ----------
+    source : Path
+        The existing file.
+    target : Path
+        The new file, e.g. inside a bundle.
+    """
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+        shutil.copymode(source, target)
+
+
+# run by the interpreter of a script to prepare its fast launcher
+_LAUNCHER_PROBE = """import base64, json, marshal, sys
+code = compile(sys.stdin.buffer.read(), sys.argv[1], "exec")
+print(json.dumps({
+    "path": sys.path,
+    "tag": sys.implementation.cache_tag,
+    "code": base64.b64encode(marshal.dumps(code)).decode(),
+}))
+"""
+
+
+def _fast_launcher_script(
+    interpreter: str, script: str, sys_path: list, flags: str, environment: dict
+) -> str:
+    """
+    Return a stub that starts a Python script with little overhead.
+
+    The stub sets the precomputed `sys.path` and runs the script from
+    Contents/Resources with the bytecode compiled at build time. Without
+    environment variables, the stub is itself a Python script whose
+    shebang carries the flags, so no shell is started.
+
+    Parameters
+    ----------
+    interpreter : str
+        The full path of the Python interpreter.
+    script : str
+        The filename of the script in Contents/Resources.
+    sys_path : list
+        The module search path (without the script directory).
+    flags : str
+        The interpreter options, e.g. '-I'.
+    environment : dict
+        Environment variables to be exported before the start.
+
+    Returns
+    -------
+    str
+        The content of the stub.
+    """
+    options = shlex.split(flags)
+    # a shebang passes at most one argument, so the flags are merged
+    shebang = not environment and " " not in interpreter
+    shebang = shebang and all(re.fullmatch(r"-[BEIOPRSbdqsuv]+", option) for option in options)
+    # the index of the stub in sys.argv ('-c' is first in the shell)
+    stub = 0 if shebang else 1
+    code = (
+        "import marshal, os, sys\n"
+        f'r = os.path.join(os.path.dirname(os.path.abspath(sys.argv[{stub}])), "..", "Resources")\n'
+        f"s = os.path.join(r, {json.dumps(script)})\n"
+        f"sys.path[:] = [r] + {json.dumps(sys_path)}\n"
+        f"sys.argv[:{stub + 1}] = [s]\n"
+        f'c = os.path.join(r, "__pycache__", {json.dumps(script)} + "."'
+        ' + sys.implementation.cache_tag + ".marshal")\n'
+        "try:\n"
+        '    with open(c, "rb") as f:\n'
+        "        c = marshal.load(f)\n"
+        "except (OSError, EOFError, ValueError, TypeError):\n"
+        '    with open(s, "rb") as f:\n'
+        '        c = compile(f.read(), s, "exec")\n'
+        'g = {"__name__": "__main__", "__file__": s, "__builtins__": __builtins__}\n'
+        "exec(c, g)\n"
+    )
+    if shebang:
+        merged = "".join(option[1:] for option in options)
+        return f"#!{interpreter}{' -' + merged if merged else ''}\n{code}"
+    lines = ["#!/bin/sh"]
+    lines += [f"export {key}={shlex.quote(value)}" for key, value in environment.items()]
+    command = shlex.join([interpreter, *options, "-c", code])
+    lines.append(f'exec {command} "$0" "$@"')
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomically(file: Path, content: FileEntry, mtime: Optional[int] = None) -> None:
+    """
+    Replace a file in one step so readers never see a partial file.
+
+    Parameters
+    ----------
+    file : Path
+        The file to be (re)placed.
+    content : FileEntry
+        The content of the file and the desired permissions.
+    mtime : int, optional
+        The modification time in seconds since the epoch. None keeps
+        the time of writing.
+    """
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_name(f".{file.name}.{os.getpid()}")
+    with open(tmp, "wb") as f:
+        f.write(content.content)
+    if content.permissions is not None:
+        os.chmod(tmp, int(content.permissions, 8))
+    if mtime is not None:
+        os.utime(tmp, (mtime, mtime))
+    os.replace(tmp, file)
+
+
+def _clone_file(source: Path, target: Path) -> None:
+    """
+    Clone a file copy-on-write and fall back to hardlinking or copying.
+
+    Parameters
+    ----------
+    source : Path
+        The existing file.
+    target : Path
+        The new file.
+    """
+    if sys.platform == "darwin":
+        if _LIBC.clonefile(bytes(source), bytes(target), 0) == 0:
+            return
+    elif sys.platform == "linux":
+        import fcntl
+
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                pass
+            else:
+                shutil.copymode(source, target)
+                return
+        target.unlink()
+    _link_or_copy(source, target)
+
+
+class _Metrics:
+    """Aggregate counters and histograms over all builds."""
+
+    # upper bounds in seconds of the histogram buckets
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self) -> None:
+        """Start with empty metrics."""
+        self.lock = threading.Lock()
+        # serializes the writes of the timer and the one at exit
+        self.write_lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = {}
+        self.histograms = {}
+        self.failures = {}
+        self.timer = None
+        self.stopped = False
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Add to a counter.
+
+        Parameters
+        ----------
+        name : str
+            The name of the counter.
+        value : int
+            The amount to be added.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Add a duration to a histogram.
+
+        Parameters
+        ----------
+        name : str
+            The name of the histogram.
+        seconds : float
+            The observed duration.
+        """
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                name, {"count": 0, "sum": 0.0, "buckets": [0] * len(self.BUCKETS)}
+            )
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+
+    def failure(self, reason: str) -> None:
+        """
+        Count a failed build.
+
+        Parameters
+        ----------
+        reason : str
+            The reason, e.g. the name of the exception.
+        """
+        with self.lock:
+            self.failures[reason] = self.failures.get(reason, 0) + 1
+
+    def snapshot(self) -> dict:
+        """
+        Return all metrics and the derived rates.
+
+        Returns
+        -------
+        dict
+            Counters, histograms (with cumulative buckets), failures by
+            reason, builds per second and the content store hit ratio.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {
+                name: dict(histogram, buckets=list(histogram["buckets"]))
+                for name, histogram in self.histograms.items()
+            }
+            failures = dict(self.failures)
+        uptime = time.monotonic() - self.started
+        hits = counters.get("content_store_hits_total", 0)
+        lookups = hits + counters.get("content_store_misses_total", 0)
+        return {
+            "uptime_seconds": uptime,
+            "builds_per_second": counters.get("builds_total", 0) / uptime,
+            "content_store_hit_ratio": hits / lookups if lookups else None,
+            "counters": counters,
+            "histograms": histograms,
+            "failures": failures,
+        }
+
+    def prometheus(self) -> str:
+        """
+        Render the snapshot in the Prometheus text format.
+
+        Returns
+        -------
+        str
+            The content of a textfile collector file.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name in ["uptime_seconds", "builds_per_second", "content_store_hit_ratio"]:
+            if snapshot[name] is not None:
+                lines.append(f"# TYPE script2bundle_{name} gauge")
+                lines.append(f"script2bundle_{name} {snapshot[name]}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE script2bundle_{name} counter")
+            lines.append(f"script2bundle_{name} {value}")
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            lines.append(f"# TYPE script2bundle_{name} histogram")
+            for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+                lines.append(f'script2bundle_{name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'script2bundle_{name}_bucket{{le="+Inf"}} {histogram["count"]}')
+            lines.append(f"script2bundle_{name}_sum {histogram['sum']}")
+            lines.append(f"script2bundle_{name}_count {histogram['count']}")
+        if snapshot["failures"]:
+            lines.append("# TYPE script2bundle_build_failures_total counter")
+        for reason, value in sorted(snapshot["failures"].items()):
+            lines.append(f'script2bundle_build_failures_total{{reason="{reason}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, file: Path) -> None:
+        """
+        Write the metrics atomically.
+
+        Parameters
+        ----------
+        file : Path
+            A '.json' file gets a JSON snapshot, anything else (e.g.
+            '.prom') the Prometheus text format.
+        """
+        with self.write_lock:
+            if file.suffix == ".json":
+                text = json.dumps(self.snapshot(), indent=2)
+            else:
+                text = self.prometheus()
+            _write_atomically(file, FileEntry(text.encode("utf-8"), None))
+
+    def export_periodically(self, file: Path, interval: float) -> None:
+        """
+        Write the metrics every `interval` seconds and at exit.
+
+        The timer is stopped before the final write at exit.
+
+        Parameters
+        ----------
+        file : Path
+            The metrics file (see `write`).
+        interval : float
+            The time between two writes in seconds.
+        """
+
+        def export():
+            self.write(file)
+            with self.lock:
+                if self.stopped:
+                    return
+                self.timer = threading.Timer(interval, export)
+                self.timer.daemon = True
+                self.timer.start()
+
+        def stop():
+            with self.lock:
+                self.stopped = True
+                if self.timer is not None:
+                    self.timer.cancel()
+            self.write(file)
+
+        atexit.register(stop)
+        export()
+
+
+METRICS = _Metrics()
+
+
+class ContentStore:
+    """Save file contents once by hash and hardlink them into apps."""
+
+    def __init__(self, root: Path) -> None:
+        """
+        Use a directory as content store.
+
+        Parameters
+        ----------
+        root : Path
+            The directory of the store. It should be on the same
+            filesystem as the bundles, otherwise files are copied.
+        """
+        self.root = root
+        self.objects = root / "objects"
+
+    def object_path(self, content: FileEntry, mtime: Optional[int] = None) -> Path:
+        """
+        Return the location of a file entry in the store.
+
+        The permissions and a fixed modification time are part of the
+        name because hardlinks share them.
+
+        Parameters
+        ----------
+        content : FileEntry
+            The content of the file and the desired permissions.
+        mtime : int, optional
+            The fixed modification time (see `set_reproducible`).
+
+        Returns
+        -------
+        Path
+            The path of the object (which might not exist yet).
+        """
+        digest = _sha256(content.content)
+        name = digest[2:]
+        if content.permissions is not None:
+            name += "." + content.permissions[2:]
+        if mtime is not None:
+            name += f"@{mtime}"
+        return self.objects / digest[:2] / name
+
+    def put(self, content: FileEntry, mtime: Optional[int] = None) -> Path:
+        """
+        Save a file entry in the store unless it is already there.
+
+        Parameters
+        ----------
+        content : FileEntry
+            The content of the file and the desired permissions.
+        mtime : int, optional
+            The fixed modification time of the object.
+
+        Returns
+        -------
+        Path
+            The path of the object.
+        """
+        path = self.object_path(content, mtime)
+        if path.exists():
+            METRICS.increment("content_store_hits_total")
+            return path
+        METRICS.increment("content_store_misses_total")
+        _write_atomically(path, content, mtime)
+        METRICS.increment("bytes_written_total", len(content.content))
+        return path
+
+    def link(self, content: FileEntry, target: Path, mtime: Optional[int] = None) -> None:
+        """
+        Place a file entry at the target via the store.
+
+        An object removed by a concurrent `collect_garbage` between
+        `put` and linking is written again.
+
+        Parameters
+        ----------
+        content : FileEntry
+            The content of the file and the desired permissions.
+        target : Path
+            The file to be created.
+        mtime : int, optional
+            The fixed modification time of the object.
+        """
+        path = self.put(content, mtime)
+        try:
+            _link_or_copy(path, target)
+        except FileNotFoundError:
+            _write_atomically(path, content, mtime)
+            _link_or_copy(path, target)
+
+    def unreferenced(self) -> list:
+        """
+        List all objects that are not linked from any bundle.
+
+        Returns
+        -------
+        list
+            The paths of the objects `collect_garbage` would remove.
+        """
+        if not self.objects.is_dir():
+            return []
+        return sorted(path for path in self.objects.glob("*/*") if path.stat().st_nlink == 1)
+
+    def collect_garbage(self) -> int:
+        """
+        Remove all objects that are not linked from any bundle.
+
+        Returns
+        -------
+        int
+            The number of removed objects.
+        """
+        removed = 0
+        for path in self.unreferenced():
+            path.unlink()
+            removed += 1
+        if not self.objects.is_dir():
+            return removed
+        for folder in self.objects.iterdir():
+            if folder.is_dir() and not any(folder.iterdir()):
+                folder.rmdir()
+        return removed
+
+
+def _render_icon(master, size: int) -> bytes:
+    """
+    Resample the master image to one size and encode it as png.
+
+    Parameters
+    ----------
+    master : PIL.Image.Image
+        The loaded master image in RGBA mode.
+    size : int
+        The edge length in pixels.
+
+    Returns
+    -------
+    bytes
+        The png encoded image.
+    """
+    from PIL import Image
+
+    image = master.resize((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _render_icon_sizes(icon: Path, workers: Optional[int] = None) -> dict:
+    """
+    Derive all standard icon sizes from a master png.
+
+    Every distinct size is resampled and encoded once in a thread pool
+    (Pillow releases the GIL for both) and shared between the media
+    types of the same size.
+
+    Parameters
+    ----------
+    icon : Path
+        The master png, ideally 1024x1024 pixels.
+    workers : int, optional
+        The number of threads. None uses the default of the pool.
+
+    Returns
+    -------
+    dict
+        The png data for each media type in `ICON_SIZES`.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        print("Please install 'Pillow' to derive all icon sizes. Exiting.")
+        sys.exit(1)
+    with Image.open(icon) as image:
+        master = image.convert("RGBA")
+    sizes = sorted(set(ICON_SIZES.values()), reverse=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pngs = dict(zip(sizes, pool.map(partial(_render_icon, master), sizes)))
+    return {key: pngs[size] for key, size in ICON_SIZES.items()}
+
+
+class ExtensionIndex:
+    """Record which app claims which extension across all builds."""
+
+    def __init__(self, database: Path) -> None:
+        """
+        Open (and create) the index.
+
+        Parameters
+        ----------
+        database : Path
+            The SQLite file of the index.
+        """
+        # transactions are started explicitly, see `claim`
+        self.connection = sqlite3.connect(database, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS claims ("
+            "extension TEXT PRIMARY KEY, identifier TEXT NOT NULL, uti TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS claims_identifier ON claims (identifier)"
+        )
+
+    def owner(self, extension: str) -> Optional[str]:
+        """
+        Return the bundle identifier claiming an extension.
+
+        Parameters
+        ----------
+        extension : str
+            The extension (lower case, without period).
+
+        Returns
+        -------
+        str or None
+            The bundle identifier or None if unclaimed.
+        """
+        row = self.connection.execute(
+            "SELECT identifier FROM claims WHERE extension = ?", (extension,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def conflicts(self, identifier: str, extensions: dict) -> dict:
+        """
+        Find extensions already claimed by another app.
+
+        Parameters
+        ----------
+        identifier : str
+            The bundle identifier of the app.
+        extensions : dict
+            The UTI for each extension of the app.
+
+        Returns
+        -------
+        dict
+            The other bundle identifier for each conflicting extension.
+        """
+        conflicts = {}
+        for extension in extensions:
+            owner = self.owner(extension)
+            if owner is not None and owner != identifier:
+                conflicts[extension] = owner
+        return conflicts
+
+    def claim(self, identifier: str, extensions: dict) -> dict:
+        """
+        Claim the extensions for an app unless another app has one.
+
+        The check and the claim run in one transaction that locks the
+        database, so concurrent builds cannot claim the same extension.
+        Claims of the app for extensions it no longer declares are
+        released.
+
+        Parameters
+        ----------
+        identifier : str
+            The bundle identifier of the app.
+        extensions : dict
+            The UTI for each extension of the app.
+
+        Returns
+        -------
+        dict
+            The other bundle identifier for each conflicting extension.
+            Nothing is claimed unless it is empty.
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            conflicts = self.conflicts(identifier, extensions)
+            if conflicts:
+                self.connection.execute("ROLLBACK")
+                return conflicts
+            self.connection.execute("DELETE FROM claims WHERE identifier = ?", (identifier,))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO claims VALUES (?, ?, ?)",
+                [(extension, identifier, uti) for extension, uti in extensions.items()],
+            )
+            self.connection.execute("COMMIT")
+        except sqlite3.Error:
+            self.connection.execute("ROLLBACK")
+            raise
+        return conflicts
+
+
 class _FilesystemDictionary:
     """Create files and folders in a dictionary."""
 
     def __init__(self):
         """Create the root directory."""
         self.directory_dict = {}
+        self.content_store = None
+        self.source_date_epoch = None
 
     def _relative_path(self, path: Path) -> Path:
         """
@@ -120,6 +822,128 @@ class _FilesystemDictionary:
         dir_ref = self._cd(file.parent)
         dir_ref[file.name] = content
 
+    def walk(self, subdirectory: Optional[dict] = None, base: Path = Path()):
+        """
+        Iterate over all files.
+
+        Parameters
+        ----------
+        subdirectory : dict, optional
+            The dict to start from. None starts from root.
+        base : Path
+            The path of `subdirectory` relative to root.
+
+        Yields
+        ------
+        tuple of (Path, FileEntry or _DiskFile)
+            The path relative to root and the file entry.
+        """
+        if subdirectory is None:
+            subdirectory = self.directory_dict
+        for name, obj in subdirectory.items():
+            if isinstance(obj, dict):
+                yield from self.walk(obj, base / name)
+            else:
+                yield base / name, obj
+
+    def read_from_disk(self, root: Path, workers: Optional[int] = None) -> None:
+        """
+        Read an existing directory tree (e.g. a bundle) for `analyze`.
+
+        Only the size and inode of each file are read in parallel; the
+        content stays on the disk. Symbolic links are skipped.
+
+        Parameters
+        ----------
+        root : Path
+            The folder on the disk that becomes root.
+        workers : int, optional
+            The number of threads. None uses the default of the pool.
+        """
+        files = []
+        for folder, subfolders, filenames in os.walk(root):
+            relative = Path(folder).relative_to(root)
+            for subfolder in subfolders:
+                self.mkdir(relative / subfolder)
+            files.extend(Path(folder) / name for name in filenames)
+        files = [file for file in files if not file.is_symlink()]
+
+        def read(file: Path) -> _DiskFile:
+            stat = file.stat()
+            return _DiskFile(file, stat.st_size, (stat.st_dev, stat.st_ino))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for file, content in zip(files, pool.map(read, files)):
+                self.save_file(file.relative_to(root), content)
+
+    def analyze(self, top: int = 10, workers: Optional[int] = None) -> dict:
+        """
+        Summarize where the bytes and files are.
+
+        Files read from the disk are hashed in chunks, once per inode.
+        Hardlinks already share their storage, so only distinct inodes
+        count towards the savings.
+
+        Parameters
+        ----------
+        top : int
+            The number of largest files to be reported.
+        workers : int, optional
+            The number of threads to hash the files with.
+
+        Returns
+        -------
+        dict
+            The total size, file count, largest files, the size per
+            directory (including subdirectories), groups of files with
+            identical content and the bytes deduplication would save.
+        """
+        # in-memory files have no inode and are keyed by their path
+        files = [
+            (path, entry, entry.inode if isinstance(entry, _DiskFile) else str(path))
+            for path, entry in self.walk()
+        ]
+        inodes = {inode: entry for _, entry, inode in files}
+
+        def hash_entry(entry) -> str:
+            if isinstance(entry, _DiskFile):
+                return _sha256_file(entry.path)
+            return _sha256(entry.content)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            digests = dict(zip(inodes, pool.map(hash_entry, inodes.values())))
+        sizes = {}
+        directories = {}
+        groups = {}
+        for path, entry, inode in files:
+            size = entry.size if isinstance(entry, _DiskFile) else len(entry.content)
+            sizes[str(path)] = size
+            for folder in path.parents:
+                directories[str(folder)] = directories.get(str(folder), 0) + size
+            paths, group_inodes = groups.setdefault(digests[inode], ([], set()))
+            paths.append(str(path))
+            group_inodes.add(inode)
+        largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:top]
+        duplicates = [
+            {
+                "sha256": digest,
+                "size": sizes[paths[0]],
+                "paths": paths,
+                "savings": sizes[paths[0]] * (len(group_inodes) - 1),
+            }
+            for digest, (paths, group_inodes) in groups.items()
+            if len(group_inodes) > 1
+        ]
+        duplicates.sort(key=lambda group: group["savings"], reverse=True)
+        return {
+            "total_size": sum(sizes.values()),
+            "file_count": len(files),
+            "largest_files": [{"path": path, "size": size} for path, size in largest],
+            "directories": dict(sorted(directories.items())),
+            "duplicates": duplicates,
+            "dedup_savings": sum(group["savings"] for group in duplicates),
+        }
+
     def write_all_to_disk(self, root: Path) -> None:
         """
         Write the directory structure and all files to disk.
@@ -143,186 +967,876 @@ class _FilesystemDictionary:
             The dict with only items in this subdirectory.
         """
         Path.mkdir(base, parents=True, exist_ok=True)
-        for name, obj in subdirectory.items():
+        for name, obj in sorted(subdirectory.items()):
             full_path = base / Path(name)
             if isinstance(obj, dict):
                 self._write_recursively(full_path, obj)
             elif isinstance(obj, FileEntry):
+                METRICS.increment("files_written_total")
+                if self.content_store is not None:
+                    self.content_store.link(obj, full_path, self.source_date_epoch)
+                    continue
                 with open(full_path, "wb") as f:
                     f.write(obj.content)
+                METRICS.increment("bytes_written_total", len(obj.content))
                 if obj.permissions is not None:
                     os.chmod(full_path, int(obj.permissions, 8))
 
+    def plan(self, root: Path) -> list:
+        """
+        List the operations `write_all_to_disk` would perform.
+
+        Nothing is written to the disk.
+
+        Parameters
+        ----------
+        root : Path
+            The reference folder on the disk that would become root.
+
+        Returns
+        -------
+        list
+            One dict per operation ('mkdir', 'write' or 'link') in the
+            order they would be executed.
+        """
+        operations = []
+        self._plan_recursively(root, self.directory_dict, operations)
+        return operations
+
+    def _plan_recursively(self, base: Path, subdirectory: dict, operations: list) -> None:
+        """
+        Collect the operations of `_write_recursively`.
+
+        Parameters
+        ----------
+        base: Path
+            The reference point on the disk.
+        subdirectory : dict
+            The dict with only items in this subdirectory.
+        operations : list
+            The list the operations are appended to.
+        """
+        operations.append({"op": "mkdir", "path": str(base)})
+        for name, obj in sorted(subdirectory.items()):
+            full_path = base / Path(name)
+            if isinstance(obj, dict):
+                self._plan_recursively(full_path, obj, operations)
+            elif isinstance(obj, FileEntry):
+                operation = {
+                    "op": "write",
+                    "path": str(full_path),
+                    "size": len(obj.content),
+                    "mode": obj.permissions,
+                    "sha256": _sha256(obj.content),
+                }
+                if self.content_store is not None:
+                    source = self.content_store.object_path(obj, self.source_date_epoch)
+                    operation.update(op="link", source=str(source))
+                operations.append(operation)
+
 
 class ApplicationBundle(_FilesystemDictionary):
     """Create application bundle and manag content."""
 
-    def __init__(self, executable: Path) -> None:
+    def __init__(self, executable: Path, content: Optional[FileEntry] = None) -> None:
         """
         Store the executable and plist in the correct directories.
 
         Parameters
         ----------
-        executable : Path
-            The full path and name of the executable to be bundled.
+        executable : Path
+            The full path and name of the executable to be bundled.
+        content : FileEntry, optional
+            The content of the executable if it is not (yet) on the
+            disk. None reads it from `executable`.
+        """
+        self._set_defaults()
+        self.original_path = executable.parent
+        self.clean_executable = re.sub(r"[^A-Za-z0-9\.-]+", "", executable.name)
+        self.set_destination("executable")
+        self.set_filename(self.clean_executable)
+        self.mkdir(Path("Contents") / Path("Resources"))
+        if content is None:
+            content = FileEntry(executable.read_bytes(), oct(executable.stat().st_mode & 0o777))
+        script = content
+        self.save_file(Path("Contents") / Path("MacOS") / self.clean_executable, script)
+        self.plist_dict = dict(CFBundleExecutable=self.clean_executable)
+        self.plist_dict.update(CFBundlePackageType="APPL")
+        self.set_CFBundleDisplayName(self.clean_executable + ".app")
+        self.set_CFBundleIdentifier(self.clean_executable)
+
+    def _set_defaults(self) -> None:
+        """Set up the empty file tree and the default attributes."""
+        _FilesystemDictionary.__init__(self)
+        self.CFBundleTypeRole = "Viewer"
+        self.template = None
+        self.template_icon = None
+        self.plist_format = plistlib.FMT_XML
+
+    @classmethod
+    def from_bundle(cls, app: Path) -> "ApplicationBundle":
+        """
+        Load an existing bundle to patch it.
+
+        Only Contents/Info.plist is read. Neither the executable nor any
+        resources are loaded, so `patch_bundle` writes back nothing but
+        the files changed by the setters.
+
+        Parameters
+        ----------
+        app : Path
+            The existing application bundle.
+
+        Returns
+        -------
+        ApplicationBundle
+            The bundle with the plist of the existing app.
+        """
+        vfs = cls.__new__(cls)
+        vfs._set_defaults()
+        plist = (app / "Contents" / "Info.plist").read_bytes()
+        vfs.plist_dict = plistlib.loads(plist)
+        if plist.startswith(b"bplist"):
+            vfs.plist_format = plistlib.FMT_BINARY
+        vfs.original_path = app.parent
+        vfs.clean_executable = vfs.plist_dict["CFBundleExecutable"]
+        vfs.destination = app.parent
+        vfs.filename = app.name
+        document_types = vfs.plist_dict.get("CFBundleDocumentTypes")
+        vfs.CFBundleTypeRole = (document_types or [{}])[0].get("CFBundleTypeRole", "Viewer")
+        return vfs
+
+    def set_CFBundleDisplayName(self, name: str) -> None:
+        """
+        Set the 'official' name of the app used by, e.g., Siri.
+
+        Paramters
+        ---------
+        name : str
+            The name to be given.
+        """
+        self.plist_dict.update(CFBundleDisplayName=name)
+
+    def set_CFBundleIdentifier(self, identifier: str) -> None:
+        """
+        Set the reverse domain name identifier for the app.
+
+        A pseudo domain identifier is used. If the identifier would be
+        'myapplication' -> 'org.script2bundle.myapplication'.
+
+        Parameters
+        ----------
+        identifier : str
+            The last part of that identifier adhering to RFC 1035.
+        """
+        identifier = "org.script2bundle." + identifier
+        if not self._is_valid_domain(identifier):
+            print(f"{identifier} is not a valid domain name as set forth in RFC 1035.")
+            sys.exit(1)
+        self.plist_dict.update(CFBundleIdentifier=identifier)
+
+    def set_filename(self, name: str) -> None:
+        """
+        Set the filename of the application.
+
+        Parameters
+        ----------
+        name : str
+            The filename without '.app'.
+        """
+        self.filename = name + ".app"
+
+    def set_destination(self, destination: str) -> None:
+        """
+        Set the destination of the bundle.
+
+        Parameters
+        ----------
+        destination : str
+            Can be 'executable' (same as input file), 'user'
+            (~/Applications) or 'system (/Applications).
+        """
+        if destination == "executable":
+            self.destination = self.original_path
+        elif destination == "system":
+            self.destination = Path("/Applications")
+        elif destination == "user":
+            self.destination = Path.home() / "Applications"
+
+    def set_icon(self, icon: Path, all_sizes: bool = False, workers: Optional[int] = None) -> None:
+        """
+        Set the icon for the app.
+
+        icon : Path
+            The directory and filename of the icon in 'png' format.
+        all_sizes : bool
+            Derive all sizes in `ICON_SIZES` from the icon (requires
+            Pillow) instead of storing it as is.
+        workers : int, optional
+            The number of threads to derive the sizes with.
+        """
+        # if icon.name[-4:] == ".png":
+        #      iconsfile = Path(icon.name[:-4] + ".icns")
+        # else:
+        iconsfile = Path(icon.stem + ".icns")
+        start = time.perf_counter()
+        icon_img = icnsutil.IcnsFile()
+        if all_sizes:
+            for key, png in _render_icon_sizes(icon, workers).items():
+                icon_img.add_media(key, data=png)
+        else:
+            icon_img.add_media(file=icon)
+        icns = FileEntry(self._icns_bytes(icon_img), None)
+        METRICS.observe("icon_encode_seconds", time.perf_counter() - start)
+        self.save_file(Path("Contents") / Path("Resources") / iconsfile, icns)
+        self.plist_dict.update(CFBundleIconFile=iconsfile.name)
+
+    def _icns_bytes(self, icon_img: icnsutil.IcnsFile) -> bytes:
+        """
+        Serialize an icns image in memory.
+
+        Same layout as `icnsutil.IcnsFile.write` (without table of
+        contents) but without the detour via a temporary file.
+
+        Parameters
+        ----------
+        icon_img : icnsutil.IcnsFile
+            The image with all its media added.
+
+        Returns
+        -------
+        bytes
+            The content of the icns file.
+        """
+        order = icon_img._make_toc(enabled=False)
+        total = sum(len(x) + 8 for x in icon_img.media.values())
+        buffer = io.BytesIO()
+        buffer.write(RawData.icns_header_w_len(b"icns", total))
+        for key in order:
+            RawData.icns_header_write_data(buffer, key, icon_img.media[key])
+        return buffer.getvalue()
+
+    def set_extension(self, extension: str) -> None:
+        """
+        Associate a file extension with the application.
+
+        Then, a double-click or 'open' on a file with that extension
+        will subsequently launch the application. The application has to
+        run at least once to 'register' the extension with the system.
+
+        Parameters
+        ----------
+        extension : str
+            ZThe extension with the preceeding period.
+        """
+        self.extension = extension
+        app_CFBundleIdentifier = self.plist_dict["CFBundleIdentifier"]
+        UTTypeIdentifier = app_CFBundleIdentifier + ".datafile"
+        if not self._is_valid_domain(UTTypeIdentifier):
+            print(f"{UTTypeIdentifier} is not a valid domain name as set forth in RFC 1035.")
+            sys.exit(1)
+        file_type = self.plist_dict["CFBundleDisplayName"] + " datafile"
+        app_CFBundleDocumentTypes = [
+            {
+                "LSItemContentTypes": [UTTypeIdentifier],
+                "CFBundleTypeName": file_type,
+                "CFBundleTypeRole": self.CFBundleTypeRole,
+            }
+        ]
+        self.plist_dict.update(CFBundleDocumentTypes=app_CFBundleDocumentTypes)
+        app_UTExportedTypeDeclarations = [
+            {
+                "UTTypeIdentifier": UTTypeIdentifier,
+                "UTTypeTagSpecification": {"public.filename-extension": extension},
+                "UTTypeConformsTo": "public.data",
+                "UTTypeDescription": file_type,
+            }
+        ]
+        self.plist_dict.update(UTExportedTypeDeclarations=app_UTExportedTypeDeclarations)
+
+    def add_document_type(self, extension: str, role: Optional[str] = None) -> str:
+        """
+        Declare a document type with its own UTI for one extension.
+
+        Unlike `set_extension`, existing document types are kept, so
+        any number of extensions can be added, each with its own role.
+        Adding an extension again replaces its document type.
+
+        Parameters
+        ----------
+        extension : str
+            The extension with or without the preceeding period.
+        role : str, optional
+            Can be 'Viewer','Editor','Shell', or 'None'. None uses the
+            role set by `set_CFBundleTypeRole`.
+
+        Returns
+        -------
+        str
+            The UTI of the new document type.
+        """
+        extension = extension.lstrip(".")
+        # the extension becomes one label of the UTI
+        if not re.fullmatch(r"[A-Za-z0-9]([A-Za-z0-9-]*[A-Za-z0-9])?", extension):
+            print(f"'{extension}' is not a valid extension as set forth in RFC 1035.")
+            sys.exit(1)
+        UTTypeIdentifier = self.plist_dict["CFBundleIdentifier"] + "." + extension.lower()
+        if not self._is_valid_domain(UTTypeIdentifier):
+            print(f"{UTTypeIdentifier} is not a valid domain name as set forth in RFC 1035.")
+            sys.exit(1)
+        file_type = f"{self.plist_dict['CFBundleDisplayName']} {extension} file"
+        self.plist_dict["CFBundleDocumentTypes"] = [
+            entry
+            for entry in self.plist_dict.get("CFBundleDocumentTypes", [])
+            if UTTypeIdentifier not in entry.get("LSItemContentTypes", [])
+        ]
+        self.plist_dict["UTExportedTypeDeclarations"] = [
+            declaration
+            for declaration in self.plist_dict.get("UTExportedTypeDeclarations", [])
+            if declaration.get("UTTypeIdentifier") != UTTypeIdentifier
+        ]
+        self.plist_dict["CFBundleDocumentTypes"].append(
+            {
+                "LSItemContentTypes": [UTTypeIdentifier],
+                "CFBundleTypeName": file_type,
+                "CFBundleTypeRole": role or self.CFBundleTypeRole,
+            }
+        )
+        self.plist_dict["UTExportedTypeDeclarations"].append(
+            {
+                "UTTypeIdentifier": UTTypeIdentifier,
+                "UTTypeTagSpecification": {"public.filename-extension": extension},
+                "UTTypeConformsTo": "public.data",
+                "UTTypeDescription": file_type,
+            }
+        )
+        return UTTypeIdentifier
+
+    def extensions(self) -> dict:
+        """
+        Return all declared extensions.
+
+        Returns
+        -------
+        dict
+            The UTI for each extension (lower case, without period).
+        """
+        extensions = {}
+        for declaration in self.plist_dict.get("UTExportedTypeDeclarations", []):
+            tags = declaration["UTTypeTagSpecification"]["public.filename-extension"]
+            if isinstance(tags, str):
+                tags = [tags]
+            for tag in tags:
+                extensions[tag.lstrip(".").lower()] = declaration["UTTypeIdentifier"]
+        return extensions
+
+    def set_fast_launcher(
+        self, flags: str = FAST_LAUNCHER_FLAGS, environment: Optional[dict] = None
+    ) -> None:
+        """
+        Start the bundled Python script via a startup-optimised stub.
+
+        The script moves to Contents/Resources and the stub, generated
+        in memory, takes its place. The interpreter is taken from the
+        shebang of the script. It computes `sys.path` and compiles the
+        script once now, with the same flags except '-S'. So '-S' can
+        skip the import of `site` and '-I' keeps PYTHONPATH of the
+        build out of the stub. Paths added by .pth files are kept, but
+        their import hooks (e.g. of some editable installs) do not run
+        with '-S'.
+
+        Parameters
+        ----------
+        flags : str
+            The interpreter options. The default isolates the script
+            from the environment. Adding '-S' skips `site`.
+        environment : dict, optional
+            Environment variables set by the stub.
+        """
+        macos = self.directory_dict["Contents"]["MacOS"]
+        script = macos[self.clean_executable]
+        shebang = script.content.split(b"\n", 1)[0].decode("utf-8", "replace")
+        command = shlex.split(shebang[2:]) if shebang.startswith("#!") else []
+        if command and Path(command[0]).name == "env":
+            command = [shutil.which(command[1]) or command[1]] + command[2:]
+        if not command or "python" not in Path(command[0]).name:
+            print(f"{self.clean_executable} is not a Python script.")
+            sys.exit(1)
+        interpreter = command[0]
+        try:
+            probe_flags = [flag for flag in shlex.split(flags) if flag != "-S"]
+            completed_process = subprocess.run(
+                [interpreter, *probe_flags, "-c", _LAUNCHER_PROBE, self.clean_executable],
+                input=script.content,
+                capture_output=True,
+                check=True,
+            )
+        except (ValueError, OSError, subprocess.CalledProcessError) as error:
+            reason = (getattr(error, "stderr", None) or b"").decode().strip() or error
+            print(f"The launcher for {interpreter} {flags} failed: {reason}")
+            sys.exit(1)
+        probe = json.loads(completed_process.stdout)
+        # without '-I', the first entry is the working directory ('')
+        sys_path = [path for path in probe["path"] if path]
+        stub = _fast_launcher_script(
+            interpreter, self.clean_executable, sys_path, flags, environment or {}
+        )
+        resources = Path("Contents") / "Resources"
+        self.save_file(resources / self.clean_executable, script)
+        bytecode = FileEntry(base64.b64decode(probe["code"]), "0o644")
+        marshalled = f"{self.clean_executable}.{probe['tag']}.marshal"
+        self.save_file(resources / "__pycache__" / marshalled, bytecode)
+        macos[self.clean_executable] = FileEntry(stub.encode("utf-8"), "0o755")
+
+    def set_template(self, template: Path) -> None:
+        """
+        Build the bundle from a template saved with `save_template`.
+
+        All files of the template are hardlinked (or copied) into the
+        bundle unless the bundle has its own version. The Info.plist of
+        the template serves as base for the app specific keys; its
+        document types are dropped as they belong to another app. The
+        icon of the template is only used while the app keeps its
+        CFBundleIconFile.
+
+        Parameters
+        ----------
+        template : Path
+            The template directory.
+        """
+        with open(template / "Contents" / "Info.plist", "rb") as f:
+            plist_dict = plistlib.load(f)
+        plist_dict.pop("CFBundleDocumentTypes", None)
+        plist_dict.pop("UTExportedTypeDeclarations", None)
+        plist_dict.update(self.plist_dict)
+        self.plist_dict = plist_dict
+        self.template = template
+        self.template_icon = plist_dict.get("CFBundleIconFile")
+
+    def save_template(self, template: Path) -> Path:
+        """
+        Write the bundle without its executable as a template.
+
+        Parameters
+        ----------
+        template : Path
+            The template directory.
+
+        Returns
+        -------
+        Path
+            The template directory.
+        """
+        if template.exists():
+            shutil.rmtree(template)
+        self._store_plist()
+        contents = self.directory_dict["Contents"]
+        skeleton = {name: obj for name, obj in contents.items() if name != "MacOS"}
+        self._write_recursively(template, {"Contents": skeleton})
+        return template
+
+    def _template_files(self, destination: Path) -> list:
+        """
+        List the template files to be placed into the bundle.
+
+        Parameters
+        ----------
+        destination : Path
+            The path and filename of the application bundle.
+
+        Returns
+        -------
+        list
+            Tuples of source in the template and target in the bundle.
+        """
+        if self.template is None:
+            return []
+        skipped = {path for path, _ in self.walk()}
+        icon = self.plist_dict.get("CFBundleIconFile")
+        if self.template_icon is not None and icon != self.template_icon:
+            skipped.add(Path("Contents") / "Resources" / self.template_icon)
+        pairs = []
+        for source in sorted(self.template.rglob("*")):
+            relative = source.relative_to(self.template)
+            if source.is_file() and relative not in skipped:
+                pairs.append((source, destination / relative))
+        return pairs
+
+    def set_plist_format(self, plist_format: str) -> None:
+        """
+        Set the format of Info.plist.
+
+        Parameters
+        ----------
+        plist_format : str
+            Can be 'xml' (default) or 'binary' (smaller and faster to
+            parse).
+        """
+        if plist_format == "binary":
+            self.plist_format = plistlib.FMT_BINARY
+        elif plist_format == "xml":
+            self.plist_format = plistlib.FMT_XML
+
+    def set_reproducible(self, source_date_epoch: Optional[int] = None) -> None:
+        """
+        Make the bundle byte-identical for identical inputs.
+
+        All files and directories get the same modification time and
+        normalized permissions (755 for directories and executables,
+        644 otherwise). Content store objects are written with them,
+        so apps still share their files. Templates cannot be used as
+        their files keep their own modification times.
+
+        Parameters
+        ----------
+        source_date_epoch : int, optional
+            The modification time in seconds since the epoch. None uses
+            the environment variable SOURCE_DATE_EPOCH (or 1980-01-01).
+        """
+        if self.template is not None:
+            print("--reproducible cannot be combined with --template.")
+            sys.exit(1)
+        if source_date_epoch is None:
+            value = os.environ.get("SOURCE_DATE_EPOCH", str(ZIP_EPOCH))
+            if not value.isdecimal():
+                print(f"SOURCE_DATE_EPOCH={value} is not a number of seconds.")
+                sys.exit(1)
+            source_date_epoch = int(value)
+        self.source_date_epoch = source_date_epoch
+
+    def _normalize_permissions(self) -> None:
+        """Set the permissions of all files to 755 or 644."""
+        for path, content in list(self.walk()):
+            executable = content.permissions is not None and int(content.permissions, 8) & 0o111
+            self.save_file(path, content._replace(permissions="0o755" if executable else "0o644"))
+
+    def _normalize_metadata(self, root: Path) -> None:
+        """
+        Set permissions and modification times of a written bundle.
+
+        This covers files from templates and content stores, too. A
+        hardlinked file that needs a change is copied first, so the
+        template or store object sharing its inode stays untouched.
+
+        Parameters
+        ----------
+        root : Path
+            The path and filename of the application bundle.
+        """
+        times = (self.source_date_epoch, self.source_date_epoch)
+        for folder, _, filenames in os.walk(root, topdown=False):
+            for name in filenames:
+                file = Path(folder) / name
+                stat = file.stat()
+                mode = 0o755 if stat.st_mode & 0o111 else 0o644
+                if (stat.st_mode & 0o777, stat.st_mtime) == (mode, self.source_date_epoch):
+                    continue
+                if stat.st_nlink > 1:
+                    tmp = file.with_name(f".{name}.{os.getpid()}")
+                    shutil.copyfile(file, tmp)
+                    os.replace(tmp, file)
+                os.chmod(file, mode)
+                os.utime(file, times)
+            os.chmod(folder, 0o755)
+            os.utime(folder, times)
+
+    def set_content_store(self, store: ContentStore) -> None:
+        """
+        Write all files via a content store.
+
+        Parameters
+        ----------
+        store : ContentStore
+            The store shared by the bundles.
+        """
+        self.content_store = store
+
+    def set_CFBundleTypeRole(self, role: str):
+        """
+        Set the bundle type role.
+
+        Parameters
+        ----------
+        role : str
+            Can be 'Viewer','Editor','Shell', or 'None'.
         """
-        super().__init__()
-        self.original_path = executable.parent
-        self.clean_executable = re.sub(r"[^A-Za-z0-9\.-]+", "", executable.name)
-        self.set_destination("executable")
-        self.set_filename(self.clean_executable)
-        self.mkdir(Path("Contents") / Path("Resources"))
-        script = FileEntry(executable.read_bytes(), oct(executable.stat().st_mode & 0o777))
-        self.save_file(Path("Contents") / Path("MacOS") / self.clean_executable, script)
-        self.plist_dict = dict(CFBundleExecutable=self.clean_executable)
-        self.plist_dict.update(CFBundlePackageType="APPL")
-        self.set_CFBundleDisplayName(self.clean_executable + ".app")
-        self.set_CFBundleIdentifier(self.clean_executable)
-        self.CFBundleTypeRole = "Viewer"
+        self.CFBundleTypeRole = role
+        for document_type in self.plist_dict.get("CFBundleDocumentTypes", []):
+            document_type.update(CFBundleTypeRole=role)
 
-    def set_CFBundleDisplayName(self, name: str) -> None:
+    def write_bundle(self) -> Path:
         """
-        Set the 'official' name of the app used by, e.g., Siri.
+        Write the bundle to the disk.
 
-        Paramters
-        ---------
-        name : str
-            The name to be given.
+        Returns
+        -------
+        Path
+            The path and filename of the application bundle.
         """
-        self.plist_dict.update(CFBundleDisplayName=name)
+        start = time.perf_counter()
+        try:
+            destination = self._write_bundle()
+        except (Exception, SystemExit) as error:
+            METRICS.failure(type(error).__name__)
+            raise
+        METRICS.increment("builds_total")
+        METRICS.observe("build_seconds", time.perf_counter() - start)
+        return destination
 
-    def set_CFBundleIdentifier(self, identifier: str) -> None:
+    def _write_bundle(self) -> Path:
         """
-        Set the reverse domain name identifier for the app.
+        Write the bundle to the disk (without metrics).
 
-        A pseudo domain identifier is used. If the identifier would be
-        'myapplication' -> 'org.script2bundle.myapplication'.
+        Returns
+        -------
+        Path
+            The path and filename of the application bundle.
+        """
+        destination = self.destination / Path(self.filename)
+        if destination.exists():
+            shutil.rmtree(destination)
+        self._store_plist()
+        if self.source_date_epoch is not None:
+            self._normalize_permissions()
+        for source, target in self._template_files(destination):
+            target.parent.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(source, target)
+        self.write_all_to_disk(destination)
+        if self.source_date_epoch is not None:
+            self._normalize_metadata(destination)
+        return destination
+
+    def publish(self, destinations: list) -> list:
+        """
+        Write the bundle to several destinations.
+
+        The bundle is written once; every further destination gets a
+        copy-on-write clone (or hardlinks, or copies) of that tree, so
+        the executable is neither read nor hashed again.
 
         Parameters
         ----------
-        identifier : str
-            The last part of that identifier adhering to RFC 1035.
-        """
-        identifier = "org.script2bundle." + identifier
-        if not self._is_valid_domain(identifier):
-            print(f"{identifier} is not a valid domain name as set forth in RFC 1035.")
-            sys.exit(1)
-        self.plist_dict.update(CFBundleIdentifier=identifier)
+        destinations : list
+            Each can be 'executable', 'user' or 'system' (see
+            `set_destination`).
 
-    def set_filename(self, name: str) -> None:
+        Returns
+        -------
+        list
+            The path and filename of each application bundle.
         """
-        Set the filename of the application.
+        bundles = self._publish_targets(destinations)
+        if bundles:
+            self.destination = bundles[0].parent
+            self.write_bundle()
+        for bundle in bundles[1:]:
+            try:
+                self._clone_bundle(bundles[0], bundle)
+            except (Exception, SystemExit) as error:
+                METRICS.failure(type(error).__name__)
+                raise
+        return bundles
+
+    def plan_publish(self, destinations: list) -> dict:
+        """
+        Plan `publish` without touching the disk.
 
         Parameters
         ----------
-        name : str
-            The filename without '.app'.
-        """
-        self.filename = name + ".app"
+        destinations : list
+            Each can be 'executable', 'user' or 'system' (see
+            `set_destination`).
 
-    def set_destination(self, destination: str) -> None:
+        Returns
+        -------
+        dict
+            The plan of `plan_bundle` for the first destination, with
+            the operations to clone it to every further destination
+            appended, and the list of all bundles.
         """
-        Set the destination of the bundle.
+        bundles = self._publish_targets(destinations)
+        self.destination = bundles[0].parent
+        plan = self.plan_bundle()
+        written = [operation for operation in plan["operations"] if operation["op"] != "rmtree"]
+        for bundle in bundles[1:]:
+            if bundle.exists():
+                plan["operations"].append({"op": "rmtree", "path": str(bundle)})
+            for operation in sorted(written, key=lambda operation: operation["op"] != "mkdir"):
+                target = bundle / Path(operation["path"]).relative_to(bundles[0])
+                if operation["op"] == "mkdir":
+                    plan["operations"].append({"op": "mkdir", "path": str(target)})
+                else:
+                    plan["operations"].append(
+                        {"op": "clone", "path": str(target), "source": operation["path"]}
+                    )
+        plan["bundles"] = [str(bundle) for bundle in bundles]
+        return plan
+
+    def _publish_targets(self, destinations: list) -> list:
+        """
+        Resolve the destinations to distinct bundle paths.
 
         Parameters
         ----------
-        destination : str
-            Can be 'executable' (same as input file), 'user'
-            (~/Applications) or 'system (/Applications).
-        """
-        if destination == "executable":
-            self.destination = self.original_path
-        elif destination == "system":
-            self.destination = Path("/Applications")
-        elif destination == "user":
-            self.destination = Path.home() / "Applications"
+        destinations : list
+            Each can be 'executable', 'user' or 'system'.
 
-    def set_icon(self, icon: Path) -> None:
+        Returns
+        -------
+        list
+            The path and filename of each application bundle, without
+            destinations that point to the same bundle.
         """
-        Set the icon for the app.
+        bundles = []
+        for destination in destinations:
+            self.set_destination(destination)
+            bundle = self.destination / Path(self.filename)
+            if bundle.resolve() not in [b.resolve() for b in bundles]:
+                bundles.append(bundle)
+        return bundles
+
+    def _clone_bundle(self, source: Path, bundle: Path) -> None:
+        """
+        Place a clone of an already written bundle.
 
-        icon : Path
-            The directory and filename of the icon in 'png' format.
+        Parameters
+        ----------
+        source : Path
+            The written bundle.
+        bundle : Path
+            The path and filename of the new bundle.
         """
-        # if icon.name[-4:] == ".png":
-        #      iconsfile = Path(icon.name[:-4] + ".icns")
-        # else:
-        iconsfile = Path(icon.stem + ".icns")
-        icon_img = icnsutil.IcnsFile()
-        icon_img.add_media(file=icon)
-        with NamedTemporaryFile(suffix=".icns") as tmp:
-            icon_img.write(tmp.name)
-            tmp.seek(0)
-            icns = FileEntry(tmp.read(), None)
-        self.save_file(Path("Contents") / Path("Resources") / iconsfile, icns)
-        self.plist_dict.update(CFBundleIconFile=iconsfile.name)
+        if bundle.exists():
+            shutil.rmtree(bundle)
+        for folder, _, filenames in os.walk(source):
+            target_folder = bundle / Path(folder).relative_to(source)
+            target_folder.mkdir(parents=True, exist_ok=True)
+            for name in filenames:
+                target = target_folder / name
+                _clone_file(Path(folder) / name, target)
+                METRICS.increment("files_written_total")
+                METRICS.increment("bytes_written_total", target.stat().st_size)
+        if self.source_date_epoch is not None:
+            self._normalize_metadata(bundle)
+
+    def patch_bundle(self) -> Path:
+        """
+        Write the changed files of a bundle loaded with `from_bundle`.
 
-    def set_extension(self, extension: str) -> None:
+        Every file is replaced atomically. An icon that is no longer
+        referenced by the plist is removed.
+
+        Returns
+        -------
+        Path
+            The path and filename of the application bundle.
         """
-        Associate a file extension with the application.
+        destination = self.destination / Path(self.filename)
+        stale_icon = self._stale_icon(destination)
+        self._store_plist()
+        for path, content in self.walk():
+            _write_atomically(destination / path, content)
+        if stale_icon is not None:
+            stale_icon.unlink(missing_ok=True)
+        return destination
 
-        Then, a double-click or 'open' on a file with that extension
-        will subsequently launch the application. The application has to
-        run at least once to 'register' the extension with the system.
+    def plan_patch(self) -> dict:
+        """
+        Plan `patch_bundle` without touching the disk.
 
-        Parameters
-        ----------
-        extension : str
-            ZThe extension with the preceeding period.
+        Returns
+        -------
+        dict
+            The bundle path, the files that would be replaced, the icon
+            that would be removed and the Info.plist rendered as XML.
         """
-        self.extension = extension
-        app_CFBundleIdentifier = self.plist_dict["CFBundleIdentifier"]
-        UTTypeIdentifier = app_CFBundleIdentifier + ".datafile"
-        if not self._is_valid_domain(UTTypeIdentifier):
-            print(f"{UTTypeIdentifier} is not a valid domain name as set forth in RFC 1035.")
-            sys.exit(1)
-        file_type = self.plist_dict["CFBundleDisplayName"] + " datafile"
-        app_CFBundleDocumentTypes = [
-            {
-                "LSItemContentTypes": [UTTypeIdentifier],
-                "CFBundleTypeName": file_type,
-                "CFBundleTypeRole": self.CFBundleTypeRole,
-            }
-        ]
-        self.plist_dict.update(CFBundleDocumentTypes=app_CFBundleDocumentTypes)
-        app_UTExportedTypeDeclarations = [
+        destination = self.destination / Path(self.filename)
+        stale_icon = self._stale_icon(destination)
+        self._store_plist()
+        operations = [
             {
-                "UTTypeIdentifier": UTTypeIdentifier,
-                "UTTypeTagSpecification": {"public.filename-extension": extension},
-                "UTTypeConformsTo": "public.data",
-                "UTTypeDescription": file_type,
+                "op": "replace",
+                "path": str(destination / path),
+                "size": len(content.content),
+                "mode": content.permissions,
+                "sha256": _sha256(content.content),
             }
+            for path, content in self.walk()
         ]
-        self.plist_dict.update(UTExportedTypeDeclarations=app_UTExportedTypeDeclarations)
-
-    def set_CFBundleTypeRole(self, role: str):
+        if stale_icon is not None and stale_icon.exists():
+            operations.append({"op": "unlink", "path": str(stale_icon)})
+        return {
+            "bundle": str(destination),
+            "operations": operations,
+            "Info.plist": plistlib.dumps(self.plist_dict).decode("utf-8"),
+        }
+
+    def _stale_icon(self, destination: Path) -> Optional[Path]:
         """
-        Set the bundle type role.
+        Return the icon of the bundle on disk that the plist drops.
 
         Parameters
         ----------
-        role : str
-            Can be 'Viewer','Editor','Shell', or 'None'.
+        destination : Path
+            The path and filename of the application bundle.
+
+        Returns
+        -------
+        Path or None
+            The icon file or None if it is still referenced.
         """
-        self.CFBundleTypeRole = role
+        with open(destination / "Contents" / "Info.plist", "rb") as f:
+            old_icon = plistlib.load(f).get("CFBundleIconFile")
+        if old_icon and old_icon != self.plist_dict.get("CFBundleIconFile"):
+            return destination / "Contents" / "Resources" / old_icon
+        return None
 
-    def write_bundle(self) -> Path:
+    def plan_bundle(self) -> dict:
         """
-        Write the bundle to the disk.
+        Plan the bundle without touching the disk.
 
         Returns
         -------
-        Path
-            The path and filename of the application bundle.
+        dict
+            The bundle path, the operations `write_bundle` would perform
+            (including the removal of an existing bundle) and the
+            Info.plist rendered as XML (whatever its format).
         """
         destination = self.destination / Path(self.filename)
+        operations = []
         if destination.exists():
-            shutil.rmtree(destination)
-        plist = plistlib.dumps(self.plist_dict)
+            operations.append({"op": "rmtree", "path": str(destination)})
+        self._store_plist()
+        if self.source_date_epoch is not None:
+            self._normalize_permissions()
+        for source, target in self._template_files(destination):
+            operations.append({"op": "link", "path": str(target), "source": str(source)})
+        operations.extend(self.plan(destination))
+        return {
+            "bundle": str(destination),
+            "operations": operations,
+            "Info.plist": plistlib.dumps(self.plist_dict).decode("utf-8"),
+        }
+
+    def _store_plist(self) -> FileEntry:
+        """
+        Render the plist dictionary into Contents/Info.plist.
+
+        The keys are sorted and the result is parsed again to make sure
+        it reproduces the plist dictionary.
+
+        Returns
+        -------
+        FileEntry
+            The rendered Info.plist.
+        """
+        plist = plistlib.dumps(self.plist_dict, fmt=self.plist_format, sort_keys=True)
+        if plistlib.loads(plist) != self.plist_dict:
+            print("Info.plist does not reproduce the plist entries.")
+            sys.exit(1)
         plist = FileEntry(plist, None)
         self.save_file(Path("Contents") / Path("Info.plist"), plist)
-        self.write_all_to_disk(destination)
-        return destination
+        return plist
 
     def _is_valid_domain(self, domain: str) -> bool:
         """
@@ -373,15 +1887,19 @@ def _create_argparser():
         type=str,
         help="The (existing) png to be used as an icon file.",
     )
+    parser.add_argument(
+        "--icon-sizes",
+        action="store_true",
+        help="Derive all icon sizes (16 to 1024, incl. @2x) from the png (requires Pillow).",
+    )
     parser.add_argument(
         "-d",
         "--destination",
         type=str,
         choices={"user", "system", "executable"},
-        default="executable",
-        const="executable",
-        nargs="?",
-        help="The destination of the .app file (default: %(default)s).",
+        default=["executable"],
+        nargs="*",
+        help="The destination(s) of the .app file (default: executable).",
     )
     parser.add_argument(
         "--launch", action="store_true", help="Launch the app to register properly."
@@ -393,14 +1911,25 @@ def _create_argparser():
         nargs="*",
         help="File extension(s) to be opened by the app.",
     )
+    parser.add_argument(
+        "--document-type",
+        type=str,
+        action="append",
+        metavar="EXTENSION[:ROLE]",
+        help="Declare a file extension with its own UTI and optionally its own role (repeatable).",
+    )
+    parser.add_argument(
+        "--extension-index",
+        type=str,
+        help="SQLite index of the extensions claimed by all apps; conflicts stop the build.",
+    )
     parser.add_argument(
         "--CFBundleTypeRole",
         type=str,
         choices={"Editor", "Viewer", "Shell", "None"},
-        default="Viewer",
         const="Viewer",
         nargs="?",
-        help="The app’s role with respect to the file extension. (default: %(default)s).",
+        help="The app’s role with respect to the file extension. (default: Viewer).",
     )
     parser.add_argument(
         "--CFBundleDisplayName",
@@ -410,6 +1939,87 @@ def _create_argparser():
     parser.add_argument(
         "--terminal", action="store_true", help="Always launch the app via a terminal."
     )
+    parser.add_argument(
+        "--reproducible",
+        action="store_true",
+        help="Fix modification times (SOURCE_DATE_EPOCH) and permissions for identical "
+        "output from identical input.",
+    )
+    parser.add_argument(
+        "--binary-plist", action="store_true", help="Write Info.plist in binary format."
+    )
+    parser.add_argument(
+        "--patch",
+        type=str,
+        help="Apply -i, -x, --CFBundleTypeRole and --CFBundleDisplayName to an existing "
+        "app without rebuilding it.",
+    )
+    parser.add_argument(
+        "--template",
+        type=str,
+        help="Build the app from a template saved with --save-template.",
+    )
+    parser.add_argument(
+        "--save-template",
+        type=str,
+        help="Save the app without its executable as a template directory and exit.",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        help="Content store directory to save files once and hardlink them into the app.",
+    )
+    parser.add_argument(
+        "--store-gc",
+        action="store_true",
+        help="Remove objects not used by any app from the --store directory and exit.",
+    )
+    parser.add_argument(
+        "--analyze",
+        type=str,
+        nargs="?",
+        const="",
+        help="Report size and composition of an existing app and exit. Without an app, "
+        "the app defined by the other options is analyzed without writing it.",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the output of --analyze as JSON."
+    )
+    parser.add_argument(
+        "--fast-launcher",
+        action="store_true",
+        help="Start a Python executable via a stub with fast startup flags and a precomputed "
+        "sys.path.",
+    )
+    parser.add_argument(
+        "--launcher-flags",
+        type=str,
+        default=FAST_LAUNCHER_FLAGS,
+        help="Interpreter options of the --fast-launcher stub (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--launcher-env",
+        type=str,
+        action="append",
+        metavar="KEY=VALUE",
+        help="Environment variable set by the --fast-launcher stub (repeatable).",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="Write build metrics to this file: JSON for '.json', else Prometheus text format.",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=60,
+        help="Seconds between two writes of --metrics (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the planned filesystem operations as JSON without writing anything.",
+    )
     return parser.parse_args()
 
 
@@ -460,6 +2070,48 @@ if __name__ == "__main__":
 """
 
 
+def _report_analysis(vfs: _FilesystemDictionary, as_json: bool) -> None:
+    """
+    Analyze a file tree and print the result.
+
+    Parameters
+    ----------
+    vfs : _FilesystemDictionary
+        The (in-memory) file tree.
+    as_json : bool
+        Print JSON instead of tables.
+    """
+    analysis = vfs.analyze()
+    if as_json:
+        print(json.dumps(analysis, indent=2))
+    else:
+        _print_analysis(analysis)
+
+
+def _print_analysis(analysis: dict) -> None:
+    """
+    Print the result of `_FilesystemDictionary.analyze` as tables.
+
+    Parameters
+    ----------
+    analysis : dict
+        The analysis to be printed.
+    """
+    print(f"Total size:     {analysis['total_size']:>12} bytes")
+    print(f"Files:          {analysis['file_count']:>12}")
+    print(f"Dedup savings:  {analysis['dedup_savings']:>12} bytes")
+    print("\nLargest files")
+    for item in analysis["largest_files"]:
+        print(f"{item['size']:>12}  {item['path']}")
+    print("\nDirectories")
+    for folder, size in analysis["directories"].items():
+        print(f"{size:>12}  {folder}")
+    if analysis["duplicates"]:
+        print("\nDuplicates")
+        for group in analysis["duplicates"]:
+            print(f"{group['size']:>12}  {', '.join(group['paths'])}")
+
+
 def _create_example() -> str:
     """Create an examplefile and return its filename."""
     executable = "example"
@@ -477,42 +2129,152 @@ def _create_example() -> str:
     return executable
 
 
-def _create_launcher(executable: Path) -> Path:
-    """Create an launcher file and return its filename."""
-    terminal_script = f"#!/bin/bash\n/usr/bin/open '{executable.resolve()}' -a Terminal"
-    terminal_filename = LAUNCHER_NAME
-    with open(terminal_filename, "w") as terminal_file:
-        terminal_file.write(terminal_script)
-    os.chmod(terminal_filename, 0o755)
-    executable = Path(terminal_filename)
-    return executable
+def _launcher_script(executable: Path) -> str:
+    """Return the content of the terminal launcher for an executable."""
+    return f"#!/bin/bash\n/usr/bin/open '{executable.resolve()}' -a Terminal"
 
 
-def main():
-    """Parse the command line and run the app."""
-    args = _create_argparser()
+def _apply_plist_options(vfs: ApplicationBundle, args: argparse.Namespace) -> None:
+    """Apply the options that change the plist (and icon) of an app."""
+    if args.CFBundleDisplayName:
+        vfs.set_CFBundleDisplayName(args.CFBundleDisplayName)
+    if args.CFBundleIconFile:
+        vfs.set_icon(Path(args.CFBundleIconFile), args.icon_sizes)
+    if args.CFBundleTypeRole:
+        vfs.set_CFBundleTypeRole(args.CFBundleTypeRole)
+    if args.binary_plist:
+        vfs.set_plist_format("binary")
+    if args.extension:
+        vfs.set_extension(args.extension)
+    for document_type in args.document_type or []:
+        extension, _, role = document_type.partition(":")
+        if role not in {"", "Editor", "Viewer", "Shell", "None"}:
+            print(f"{role} is not a valid role for {extension}.")
+            sys.exit(1)
+        vfs.add_document_type(extension, role or None)
+
+
+def _create_bundle(args: argparse.Namespace) -> ApplicationBundle:
+    """Create the (in-memory) app from the command line options."""
     app_executable = args.executable
+    content = None
     if app_executable is None:
-        app_executable = _create_example()
+        # neither a dry run nor an analysis may write the example file
+        if args.dry_run or args.analyze is not None:
+            app_executable = "example"
+            content = FileEntry(_example_content.encode("utf-8"), "0o755")
+        else:
+            app_executable = _create_example()
     executable = Path(app_executable)
     if args.terminal:
-        executable = _create_launcher(executable)
-    vfs = ApplicationBundle(executable)
+        content = FileEntry(_launcher_script(executable).encode("utf-8"), "0o755")
+        executable = Path(LAUNCHER_NAME)
+    vfs = ApplicationBundle(executable, content)
+    if args.fast_launcher:
+        vfs.set_fast_launcher(args.launcher_flags, _launcher_environment(args.launcher_env))
+    if args.template:
+        vfs.set_template(Path(args.template))
     if args.destination:
-        vfs.set_destination(args.destination)
+        vfs.set_destination(args.destination[0])
     if args.filename:
         vfs.set_filename(args.filename)
     else:
         vfs.set_filename(app_executable)
-    if args.CFBundleDisplayName:
-        vfs.set_CFBundleDisplayName(args.CFBundleDisplayName)
-    if args.CFBundleIconFile:
-        vfs.set_icon(Path(args.CFBundleIconFile))
-    if args.CFBundleTypeRole:
-        vfs.set_CFBundleTypeRole(args.CFBundleTypeRole)
-    if args.extension:
-        vfs.set_extension(args.extension)
-    appname = vfs.write_bundle()
+    _apply_plist_options(vfs, args)
+    if args.store:
+        vfs.set_content_store(ContentStore(Path(args.store)))
+    if args.reproducible:
+        vfs.set_reproducible()
+    return vfs
+
+
+def _launcher_environment(items: Optional[list]) -> dict:
+    """Parse the KEY=VALUE items of --launcher-env or exit."""
+    environment = {}
+    for item in items or []:
+        key, separator, value = item.partition("=")
+        if not separator or not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", key):
+            print(f"{item} is not a valid KEY=VALUE environment variable.")
+            sys.exit(1)
+        environment[key] = value
+    return environment
+
+
+def _check_extensions(vfs: ApplicationBundle, args: argparse.Namespace) -> None:
+    """Claim the extensions of the app; exit if another app has one."""
+    if args.extension_index is None:
+        return
+    index = ExtensionIndex(Path(args.extension_index))
+    identifier = vfs.plist_dict["CFBundleIdentifier"]
+    conflicts = index.claim(identifier, vfs.extensions())
+    for extension, owner in conflicts.items():
+        print(f"The extension {extension} is already claimed by {owner}.")
+    if conflicts:
+        sys.exit(1)
+
+
+def _existing_app(app: str) -> Path:
+    """Return the path of an existing app or exit."""
+    if not Path(app).is_dir():
+        print(f"{app} is not an existing app.")
+        sys.exit(1)
+    return Path(app)
+
+
+def _collect_garbage(args: argparse.Namespace) -> None:
+    """Remove (or on a dry run list) unreferenced store objects."""
+    if args.store is None:
+        print("--store-gc requires --store.")
+        sys.exit(1)
+    store = ContentStore(Path(args.store))
+    if args.dry_run:
+        operations = [{"op": "unlink", "path": str(path)} for path in store.unreferenced()]
+        print(json.dumps({"operations": operations}, indent=2))
+        return
+    removed = store.collect_garbage()
+    print(f"Removed {removed} unreferenced objects.")
+
+
+def _patch_app(args: argparse.Namespace) -> None:
+    """Apply the plist options to an existing app."""
+    vfs = ApplicationBundle.from_bundle(_existing_app(args.patch))
+    _apply_plist_options(vfs, args)
+    if args.dry_run:
+        print(json.dumps(vfs.plan_patch(), indent=2))
+        return
+    _check_extensions(vfs, args)
+    vfs.patch_bundle()
+
+
+def main():
+    """Parse the command line and run the app."""
+    args = _create_argparser()
+    if args.metrics:
+        METRICS.export_periodically(Path(args.metrics), args.metrics_interval)
+    if args.store_gc:
+        _collect_garbage(args)
+        return
+    if args.analyze:
+        vfs = _FilesystemDictionary()
+        vfs.read_from_disk(_existing_app(args.analyze))
+        _report_analysis(vfs, args.json)
+        return
+    if args.patch:
+        _patch_app(args)
+        return
+    vfs = _create_bundle(args)
+    if args.analyze is not None:
+        vfs._store_plist()
+        _report_analysis(vfs, args.json)
+        return
+    if args.dry_run:
+        print(json.dumps(vfs.plan_publish(args.destination or ["executable"]), indent=2))
+        return
+    if args.save_template:
+        vfs.save_template(Path(args.save_template))
+        return
+    _check_extensions(vfs, args)
+    appname = vfs.publish(args.destination or ["executable"])[0]
     # Launch if requested;
     # sleep required to allow the system to recognize the new app
     if args.launch:
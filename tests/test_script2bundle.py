@@ -1,16 +1,21 @@
 """Test the script2bundle options for proper function."""
 
+import json
 import os
 import plistlib
 import random
 import re
+import shutil
 import string
+import struct
 import subprocess
 import sys
+import tarfile
 import time
 from pathlib import Path
 from typing import List
 
+import icnsutil
 import pytest
 
 python_executable = sys.executable
@@ -229,6 +234,54 @@ def test_icon() -> None:
     assert plist["CFBundleIconFile"] == name + ".icns"
     icon_file = Path(file) / "Contents" / "Resources" / Path(name + ".icns")
     assert icon_file.is_file()
+    # the in-memory icns must match the layout written by icnsutil
+    reference = icnsutil.IcnsFile()
+    reference.add_media(file=str(Path("media") / Path(name + ".png")))
+    reference.write("s2breference.icns")
+    assert icon_file.read_bytes() == Path("s2breference.icns").read_bytes()
+
+
+@pytest.mark.ci
+def test_icon_sizes() -> None:
+    """Test that every media type is derived at its pixel size."""
+    pytest.importorskip("PIL")
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        name,
+        "-i",
+        Path("media") / "icon.png",
+        "--icon-sizes",
+    ]
+    file = Path(name + ".app")
+    bundle(command_list, file)
+    icon_file = Path(file) / "Contents" / "Resources" / "icon.icns"
+    icns = icnsutil.IcnsFile(str(icon_file))
+    icns.write("s2breference.icns")
+    assert icon_file.read_bytes() == Path("s2breference.icns").read_bytes()
+    media = icns.media
+    expected = {
+        "icp4": 16,
+        "ic11": 32,
+        "icp5": 32,
+        "ic12": 64,
+        "ic07": 128,
+        "ic13": 256,
+        "ic08": 256,
+        "ic14": 512,
+        "ic09": 512,
+        "ic10": 1024,
+    }
+    assert set(media) == set(expected)
+    for key, size in expected.items():
+        assert media[key][:8] == b"\x89PNG\r\n\x1a\n"
+        assert struct.unpack(">II", media[key][16:24]) == (size, size)
 
 
 destinations = ["user", "system"]
@@ -401,3 +454,520 @@ def test_executable(cirunner: bool) -> None:
     bundle(command_list, file)
     open_app(file)
     kill_app(cirunner, name)
+
+
+@pytest.mark.ci
+def test_dry_run() -> None:
+    """Test that a dry run prints the plan and writes nothing."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    files_before = set(Path.cwd().glob("*"))
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        name,
+        "--terminal",
+        "--dry-run",
+    ]
+    completed_process = subprocess.run(command_list, capture_output=True, text=True)
+    assert completed_process.returncode == 0
+    assert set(Path.cwd().glob("*")) == files_before
+    plan = json.loads(completed_process.stdout)
+    assert plan["bundle"] == name + ".app"
+    writes = [op for op in plan["operations"] if op["op"] == "write"]
+    paths = [Path(op["path"]) for op in writes]
+    assert Path(name + ".app") / "Contents" / "MacOS" / "terminallauncher" in paths
+    assert plistlib.loads(plan["Info.plist"].encode("utf-8"))["CFBundleExecutable"] == (
+        "terminallauncher"
+    )
+    user_file = Path.home() / "Applications" / (name + ".app")
+    command_list += ["-d", "executable", "user"]
+    completed_process = subprocess.run(command_list, capture_output=True, text=True)
+    assert completed_process.returncode == 0
+    assert not user_file.exists()
+    plan = json.loads(completed_process.stdout)
+    assert plan["bundles"] == [name + ".app", str(user_file)]
+    clones = {Path(op["path"]) for op in plan["operations"] if op["op"] == "clone"}
+    assert {user_file / path.relative_to(name + ".app") for path in paths} <= clones
+
+
+@pytest.mark.ci
+def test_content_store() -> None:
+    """Test that two apps share their files via the content store."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    store = "s2bstore"
+    apps = [Path("first.app"), Path("second.app")]
+    for app in apps:
+        command_list = [
+            python_executable,
+            "-m",
+            "script2bundle",
+            "-e",
+            name,
+            "-f",
+            app.stem,
+            "--store",
+            store,
+        ]
+        bundle(command_list, app)
+    executables = [app / "Contents" / "MacOS" / name for app in apps]
+    assert os.path.samefile(*executables)
+    assert executables[0].stat().st_nlink == 3
+    for app in apps:
+        shutil.rmtree(app)
+    objects = sorted((Path(store) / "objects").glob("*/*"))
+    command_list = [python_executable, "-m", "script2bundle", "--store", store, "--store-gc"]
+    completed_process = subprocess.run(
+        command_list + ["--dry-run"], capture_output=True, text=True
+    )
+    assert completed_process.returncode == 0
+    operations = json.loads(completed_process.stdout)["operations"]
+    assert [Path(op["path"]) for op in operations] == objects
+    assert sorted((Path(store) / "objects").glob("*/*")) == objects
+    completed_process = subprocess.run(command_list)
+    assert completed_process.returncode == 0
+    assert not any((Path(store) / "objects").glob("*/*"))
+
+
+@pytest.mark.ci
+def test_template() -> None:
+    """Test stamping apps from a template saved with --save-template."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    template = Path("s2btemplate")
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        name,
+        "-i",
+        Path("media") / "icon.png",
+        "-x",
+        "s2b",
+        "--save-template",
+        template,
+    ]
+    bundle(command_list, template)
+    template_icon = template / "Contents" / "Resources" / "icon.icns"
+    assert not (template / "Contents" / "MacOS").exists()
+    assert "CFBundleDocumentTypes" in get_plist(template)
+    file = Path("stamped.app")
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        name,
+        "-f",
+        file.stem,
+        "--template",
+        template,
+    ]
+    bundle(command_list, file)
+    icon_file = file / "Contents" / "Resources" / "icon.icns"
+    assert os.path.samefile(template_icon, icon_file)
+    assert template_icon.stat().st_nlink == 2
+    plist = get_plist(file)
+    assert plist["CFBundleExecutable"] == name
+    assert plist["CFBundleIdentifier"].endswith("." + name)
+    assert plist["CFBundleIconFile"] == "icon.icns"
+    assert "CFBundleDocumentTypes" not in plist
+    assert "UTExportedTypeDeclarations" not in plist
+    shutil.copy(Path("media") / "icon.png", "s2bicon.png")
+    file = Path("restamped.app")
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        name,
+        "-f",
+        file.stem,
+        "-i",
+        "s2bicon.png",
+        "--template",
+        template,
+    ]
+    bundle(command_list, file)
+    resources = file / "Contents" / "Resources"
+    assert get_plist(file)["CFBundleIconFile"] == "s2bicon.icns"
+    assert sorted(path.name for path in resources.iterdir()) == ["s2bicon.icns"]
+
+
+@pytest.mark.ci
+def test_analyze() -> None:
+    """Test the analysis of an existing app."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    file = Path(name + ".app")
+    command_list = [python_executable, "-m", "script2bundle", "-e", name]
+    bundle(command_list, file)
+    resources = file / "Contents" / "Resources"
+    for copy in ["a.py", "b.py"]:
+        shutil.copy(name, resources / copy)
+    os.link(resources / "a.py", resources / "c.py")
+    command_list = [python_executable, "-m", "script2bundle", "--analyze", str(file), "--json"]
+    completed_process = subprocess.run(command_list, capture_output=True, text=True)
+    assert completed_process.returncode == 0
+    analysis = json.loads(completed_process.stdout)
+    assert analysis["file_count"] == 5
+    assert analysis["directories"]["Contents/Resources"] == 3 * len(minimal_file)
+    # the hardlink c.py shares the storage of a.py and saves nothing
+    assert analysis["dedup_savings"] == 2 * len(minimal_file)
+    assert len(analysis["duplicates"][0]["paths"]) == 4
+    files_before = set(Path.cwd().glob("*"))
+    command_list = [python_executable, "-m", "script2bundle", "--analyze", "--json"]
+    completed_process = subprocess.run(command_list, capture_output=True, text=True)
+    assert completed_process.returncode == 0
+    assert json.loads(completed_process.stdout)["file_count"] == 2
+    assert set(Path.cwd().glob("*")) == files_before
+
+
+@pytest.mark.ci
+def test_patch() -> None:
+    """Test patching the plist of an existing app in place."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    file = Path(name + ".app")
+    command_list = [python_executable, "-m", "script2bundle", "-e", name, "-x", "s2bfile"]
+    bundle(command_list, file)
+    executable = file / "Contents" / "MacOS" / name
+    before = executable.stat()
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "--patch",
+        str(file),
+        "--CFBundleDisplayName",
+        "Patched",
+        "--CFBundleTypeRole",
+        "Editor",
+    ]
+    bundle(command_list, file)
+    after = executable.stat()
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    plist = get_plist(file)
+    assert plist["CFBundleDisplayName"] == "Patched"
+    assert plist["CFBundleDocumentTypes"][0]["CFBundleTypeRole"] == "Editor"
+    plist_bytes = (file / "Contents" / "Info.plist").read_bytes()
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "--patch",
+        str(file),
+        "--CFBundleDisplayName",
+        "Dry",
+        "--dry-run",
+    ]
+    completed_process = subprocess.run(command_list, capture_output=True, text=True)
+    assert completed_process.returncode == 0
+    assert (file / "Contents" / "Info.plist").read_bytes() == plist_bytes
+    plan = json.loads(completed_process.stdout)
+    assert [op["path"] for op in plan["operations"]] == [str(file / "Contents" / "Info.plist")]
+    assert plistlib.loads(plan["Info.plist"].encode("utf-8"))["CFBundleDisplayName"] == "Dry"
+    plist["CFBundleDocumentTypes"] = []
+    with open(file / "Contents" / "Info.plist", "wb") as output_file:
+        plistlib.dump(plist, output_file)
+    command_list = [python_executable, "-m", "script2bundle", "--patch", str(file), "-x", "s2b"]
+    bundle(command_list, file)
+    assert get_plist(file)["CFBundleDocumentTypes"][0]["CFBundleTypeRole"] == "Viewer"
+
+
+@pytest.mark.ci
+def test_document_types() -> None:
+    """Test several document types and the extension index."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    file = Path(name + ".app")
+    index = "s2bindex.sqlite"
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        name,
+        "--document-type",
+        "s2bone:Editor",
+        "--document-type",
+        "s2btwo",
+        "--extension-index",
+        index,
+    ]
+    bundle(command_list, file)
+    plist = get_plist(file)
+    identifier = "org.script2bundle." + name
+    document_types = plist["CFBundleDocumentTypes"]
+    assert [entry["LSItemContentTypes"] for entry in document_types] == [
+        [identifier + ".s2bone"],
+        [identifier + ".s2btwo"],
+    ]
+    assert [entry["CFBundleTypeRole"] for entry in document_types] == ["Editor", "Viewer"]
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "--patch",
+        str(file),
+        "--document-type",
+        "s2bone:Shell",
+        "--extension-index",
+        index,
+    ]
+    bundle(command_list, file)
+    plist = get_plist(file)
+    roles = {
+        entry["LSItemContentTypes"][0]: entry["CFBundleTypeRole"]
+        for entry in plist["CFBundleDocumentTypes"]
+    }
+    assert roles == {identifier + ".s2bone": "Shell", identifier + ".s2btwo": "Viewer"}
+    assert len(plist["UTExportedTypeDeclarations"]) == 2
+    for invalid in [":Editor", "s2b_one", "s2b.one", "s2b-"]:
+        command_list[-3] = invalid
+        completed_process = subprocess.run(command_list, capture_output=True, text=True)
+        assert completed_process.returncode == 1
+        assert "RFC 1035" in completed_process.stdout
+    assert get_plist(file) == plist
+    other = "s2bother"
+    shutil.copy(name, other)
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        other,
+        "--document-type",
+        "s2btwo",
+        "--extension-index",
+        index,
+    ]
+    completed_process = subprocess.run(command_list, capture_output=True, text=True)
+    assert completed_process.returncode == 1
+    assert identifier in completed_process.stdout
+    assert not Path(other + ".app").exists()
+
+
+@pytest.mark.ci
+def test_binary_plist() -> None:
+    """Test writing Info.plist in binary format."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    file = Path(name + ".app")
+    command_list = [python_executable, "-m", "script2bundle", "-e", name, "--binary-plist"]
+    bundle(command_list, file)
+    plist_file = file / "Contents" / "Info.plist"
+    assert plist_file.read_bytes().startswith(b"bplist00")
+    assert get_plist(file)["CFBundleExecutable"] == name
+
+
+def archive(app: Path) -> bytes:
+    """
+    Archive an app with sorted entries.
+
+    Parameters
+    ----------
+    app : Path
+        The app to be archived.
+
+    Returns
+    -------
+    bytes
+        The uncompressed tar archive.
+    """
+    archive_file = app.with_suffix(".tar")
+    with tarfile.open(archive_file, "w", format=tarfile.PAX_FORMAT) as tar:
+        for path in sorted(app.rglob("*")):
+            tar.add(path, arcname=path.relative_to(app), recursive=False)
+    return archive_file.read_bytes()
+
+
+@pytest.mark.ci
+def test_reproducible() -> None:
+    """Test that two builds produce identical trees and archives."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o775)
+    env = dict(os.environ, SOURCE_DATE_EPOCH="1700000000")
+    apps = [Path("first.app"), Path("second.app")]
+    for app in apps:
+        command_list = [
+            python_executable,
+            "-m",
+            "script2bundle",
+            "-e",
+            name,
+            "-f",
+            app.stem,
+            "-i",
+            str(Path("media") / "icon.png"),
+            "--reproducible",
+        ]
+        completed_process = subprocess.run(command_list, env=env)
+        assert completed_process.returncode == 0
+        time.sleep(1)
+    trees = []
+    for app in apps:
+        tree = {}
+        for path in sorted(app.rglob("*")):
+            stat = path.stat()
+            content = path.read_bytes() if path.is_file() else None
+            tree[path.relative_to(app)] = (content, stat.st_mode, stat.st_mtime)
+        trees.append(tree)
+    assert trees[0] == trees[1]
+    assert {mtime for _, _, mtime in trees[0].values()} == {1700000000}
+    assert archive(apps[0]) == archive(apps[1])
+    store = Path("s2bstore")
+    stored = [Path("third.app"), Path("fourth.app")]
+    for app in stored:
+        completed_process = subprocess.run(
+            command_list + ["-f", app.stem, "--store", store], env=env
+        )
+        assert completed_process.returncode == 0
+    files = [path.relative_to(stored[0]) for path in stored[0].rglob("*") if path.is_file()]
+    assert files
+    for path in files:
+        assert os.path.samefile(stored[0] / path, stored[1] / path)
+        stat = (stored[0] / path).stat()
+        assert (stat.st_nlink, stat.st_mtime) == (3, 1700000000)
+    assert all(path.stat().st_nlink == 3 for path in store.glob("objects/*/*"))
+    template = Path("s2btemplate")
+    command_list = [python_executable, "-m", "script2bundle", "-e", name]
+    completed_process = subprocess.run(command_list + ["--save-template", template])
+    assert completed_process.returncode == 0
+    completed_process = subprocess.run(
+        command_list + ["--template", template, "--reproducible"], capture_output=True, text=True
+    )
+    assert completed_process.returncode == 1
+    assert "--template" in completed_process.stdout
+    command_list.append("--reproducible")
+    env = dict(os.environ, SOURCE_DATE_EPOCH="abc")
+    completed_process = subprocess.run(command_list, env=env, capture_output=True, text=True)
+    assert completed_process.returncode == 1
+    assert "SOURCE_DATE_EPOCH" in completed_process.stdout
+    env.pop("SOURCE_DATE_EPOCH")
+    completed_process = subprocess.run(command_list, env=env)
+    assert completed_process.returncode == 0
+    shutil.make_archive("s2barchive", "zip", name + ".app")
+
+
+@pytest.mark.ci
+def test_fast_launcher() -> None:
+    """Test the startup-optimised launcher stub."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(
+            f"#!{python_executable}\nimport os, sys\n"
+            "print(sys.flags.isolated, sys.flags.no_site, os.environ['S2B'], sys.argv[1])\n"
+        )
+    os.chmod(name, 0o755)
+    file = Path(name + ".app")
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        name,
+        "--fast-launcher",
+        "--launcher-env",
+        "S2B=set by stub",
+    ]
+    completed_process = subprocess.run(
+        command_list + ["--launcher-env", "S2B;touch s2binjected=1"],
+        capture_output=True,
+        text=True,
+    )
+    assert completed_process.returncode == 1
+    assert not file.exists()
+    completed_process = subprocess.run(
+        command_list, env=dict(os.environ, PYTHONPATH="/s2b/build/only")
+    )
+    assert completed_process.returncode == 0
+    assert (file / "Contents" / "Resources" / name).is_file()
+    stub = file / "Contents" / "MacOS" / name
+    assert "/s2b/build/only" not in stub.read_text()
+    completed_process = subprocess.run([stub, "argument"], capture_output=True, text=True)
+    assert completed_process.stdout == "1 0 set by stub argument\n"
+    command_list = command_list[:-2] + ["--launcher-flags", "-I -S"]
+    bundle(command_list, file)
+    assert stub.read_text().startswith(f"#!{python_executable} -IS\n")
+    assert list((file / "Contents" / "Resources" / "__pycache__").glob(name + ".*.marshal"))
+    env = dict(os.environ, S2B="inherited")
+    completed_process = subprocess.run([stub, "a b"], capture_output=True, text=True, env=env)
+    assert completed_process.stdout == "1 1 inherited a b\n"
+    command_list[-1] = "-I; touch s2binjected"
+    completed_process = subprocess.run(command_list, capture_output=True, text=True)
+    assert completed_process.returncode == 1
+    assert not Path("s2binjected").exists()
+
+
+@pytest.mark.ci
+def test_metrics() -> None:
+    """Test the JSON metrics snapshot written at exit."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    file = Path(name + ".app")
+    metrics = Path("s2bmetrics.json")
+    command_list = [python_executable, "-m", "script2bundle", "-e", name, "--metrics", metrics]
+    bundle(command_list, file)
+    snapshot = json.loads(metrics.read_text())
+    assert snapshot["counters"]["builds_total"] == 1
+    assert snapshot["counters"]["files_written_total"] == 2
+    assert snapshot["histograms"]["build_seconds"]["count"] == 1
+    assert snapshot["failures"] == {}
+
+
+@pytest.mark.ci
+def test_multiple_destinations() -> None:
+    """Test publishing one app to several destinations."""
+    name = "s2btest"
+    with open(name, "w") as examplefile:
+        examplefile.write(minimal_file)
+    os.chmod(name, 0o755)
+    file = Path(name + ".app")
+    user_file = Path.home() / "Applications" / file
+    metrics = Path("s2bmetrics.json")
+    command_list = [
+        python_executable,
+        "-m",
+        "script2bundle",
+        "-e",
+        name,
+        "-d",
+        "executable",
+        "user",
+        "--metrics",
+        metrics,
+    ]
+    bundle(command_list, file)
+    assert user_file.exists()
+    # the clone counts as written like the first bundle
+    size = sum(path.stat().st_size for path in file.rglob("*") if path.is_file())
+    counters = json.loads(metrics.read_text())["counters"]
+    assert counters["files_written_total"] == 4
+    assert counters["bytes_written_total"] == 2 * size
+    for app_file in [Path("Contents") / "Info.plist", Path("Contents") / "MacOS" / name]:
+        assert (user_file / app_file).read_bytes() == (file / app_file).read_bytes()
+    assert os.access(user_file / "Contents" / "MacOS" / name, os.X_OK)
+    shutil.rmtree(user_file)